@@ -2,6 +2,7 @@
 import os
 import sys
 import requests
+from charset_normalizer import from_bytes as charset_from_bytes # Ships with requests
 import tempfile
 import threading
 import zipfile
@@ -11,11 +12,17 @@ from urllib.parse import urlparse, urljoin
 from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError
 import traceback
 import time
+import queue # Job queue for the persistent Chrome render thread
+import atexit
+import gzip # For compressing cached JSON responses
+import hashlib # For on-disk cache keys
+import json
 import mimetypes
 import pathlib # For robust path/URI handling
 import asyncio # Required for Playwright async (if using async version)
-import re # For cleaning styles (though not used in this version)
+import re # For the mojibake fix-up pass
 import platform # Required for get_chrome_path
+import shutil # shutil.which fallback in get_chrome_path
 import multiprocessing # Added for cpu_count
 # <<< Added imports for connection pooling >>>
 from requests.adapters import HTTPAdapter
@@ -24,7 +31,8 @@ from urllib3.poolmanager import PoolManager
 from dateutil.relativedelta import relativedelta
 # <<< Added import for calendar & defaultdict >>>
 import calendar
-from collections import defaultdict
+from collections import defaultdict, deque, OrderedDict
+from functools import lru_cache
 from typing import Dict, List, Tuple, Optional # Added Optional for type hinting
 import csv # <<< Added for CSV report generation >>>
 
@@ -33,7 +41,7 @@ import csv # <<< Added for CSV report generation >>>
 # pip install Flask waitress beautifulsoup4 requests playwright lxml html5lib python-dateutil urllib3
 try:
     from bs4 import BeautifulSoup
-    from flask import Flask, request, render_template_string, send_file, url_for, jsonify
+    from flask import Flask, request, send_file, url_for, jsonify
     from waitress import serve
     # --- Use Playwright Sync API ---
     from playwright.sync_api import sync_playwright, Error as PlaywrightError, TimeoutError as PlaywrightTimeoutError
@@ -43,6 +51,19 @@ except ModuleNotFoundError as e:
     print("Try: pip install Flask waitress beautifulsoup4 requests playwright lxml html5lib python-dateutil urllib3")
     sys.exit(1)
 
+# json_loads: submissions index + its older pages; orjson when installed, else the stdlib
+try:
+    from orjson import loads as json_loads
+except ModuleNotFoundError:
+    from json import loads as json_loads
+
+# Optional in-process PDF engine (pip install weasyprint); without it every PDF goes through Chrome
+try:
+    from weasyprint import HTML as WeasyHTML, CSS as WeasyCSS
+    from weasyprint.text.fonts import FontConfiguration as WeasyFontConfiguration
+except (ImportError, OSError): # OSError: the Pango/cairo system libraries are missing
+    WeasyHTML = WeasyCSS = WeasyFontConfiguration = None
+
 
 # --- Constants and Configuration ---
 # <<< User-Agent Configuration >>>
@@ -60,6 +81,23 @@ CHROME_PATH = {
     'linux': '/usr/bin/google-chrome'
 }
 
+# PDF engine: 'weasyprint' renders in-process (no browser launch per filing) and falls back to
+# Chrome if it fails; 'chrome' always uses headless Chrome via Playwright.
+PDF_ENGINE = os.getenv('MZANSI_PDF_ENGINE', 'weasyprint' if WeasyHTML else 'chrome').lower()
+if PDF_ENGINE == 'weasyprint' and WeasyHTML is None:
+    print("Warning: MZANSI_PDF_ENGINE=weasyprint but WeasyPrint is not installed; using Chrome.")
+    PDF_ENGINE = 'chrome'
+print(f"--- Using PDF engine: {PDF_ENGINE} ---")
+PDF_CONTENT_ZOOM = 0.8 # Chrome's page.pdf scale; WeasyPrint's zoom
+# WeasyPrint's zoom scales @page size and margins too, so declare Letter/1cm divided by the zoom:
+# at 0.8 this comes out as the Chrome path's page exactly (8.5x11in Letter, 1cm margins)
+WEASYPRINT_PAGE_CSS = (f"@page {{ size: {8.5 / PDF_CONTENT_ZOOM:g}in {11 / PDF_CONTENT_ZOOM:g}in; "
+                       f"margin: {1 / PDF_CONTENT_ZOOM:g}cm; }}")
+# Parsed once and shared by every render (like pdf_render.get_styling in streamlit_app.py)
+if PDF_ENGINE == 'weasyprint':
+    weasyprint_font_config = WeasyFontConfiguration()
+    weasyprint_page_css = WeasyCSS(string=WEASYPRINT_PAGE_CSS, font_config=weasyprint_font_config)
+
 # Create a global requests session
 session = requests.Session()
 # <<< Configure connection pool size >>>
@@ -70,6 +108,17 @@ session.mount('https://', adapter)
 session.headers.update(HEADERS) # Apply the determined User-Agent
 DEFAULT_TIMEOUT = 20
 max_workers=10
+ASSET_DOWNLOAD_WORKERS = 8
+ASSET_CACHE_MAX_BYTES = 256 * 1024 * 1024 # In-memory asset bodies shared across filings (LRU beyond this)
+# Shared by all filing workers, so asset fetches stay bounded however many filings run at once
+asset_executor = ThreadPoolExecutor(max_workers=ASSET_DOWNLOAD_WORKERS, thread_name_prefix="asset")
+
+# Common UTF-8-read-as-cp1252 mojibake in EDGAR filings, fixed in one regex pass instead of one
+# str.replace pass per pair (longest keys first so overlapping sequences match correctly)
+_MOJIBAKE = { "Â\x9d": "\"", "â€œ": "\"", "â€™": "'", "â€˜": "'", "â€“": "-", "â€”": "—", "&nbsp;": " ", "\u00a0": " " }
+_MOJIBAKE_RE = re.compile("|".join(re.escape(k) for k in sorted(_MOJIBAKE, key=len, reverse=True)))
+# Asset filename sanitizer: one C-level substitution instead of a per-character generator
+_UNSAFE_ASSET_CHARS_RE = re.compile(r"[^A-Za-z0-9._-]")
 
 # --- NEW: Expected FY 8-K Filing Months based on user's table ---
 # Key: Fiscal Year End Month (int)
@@ -673,8 +722,9 @@ FORM_TEMPLATE = """
 
 # --- Backend Functions ---
 
+@lru_cache(maxsize=None) # The install doesn't move while the server runs; probe the filesystem once
 def get_chrome_path():
-    """Gets the path to the Chrome executable based on the OS."""
+    """Gets the path to the Chrome executable based on the OS, falling back to a PATH lookup."""
     system = platform.system().lower()
     path = CHROME_PATH.get(system)
     if path and os.path.exists(path):
@@ -687,9 +737,13 @@ def get_chrome_path():
     elif system == 'linux':
         for p in ['/usr/bin/google-chrome-stable', '/usr/bin/google-chrome', '/opt/google/chrome/chrome']:
             if os.path.exists(p): return p
+    for name in ['google-chrome-stable', 'google-chrome', 'chromium', 'chromium-browser', 'chrome']:
+        path = shutil.which(name)
+        if path: return path
     return None
 
 # --- NEW: 8K Labeling Logic based on distance from FYE ---
+@lru_cache(maxsize=4096) # Pure function of hashable args; a run repeats the same dates/FYE/adjust
 def get_8k_period_label_by_distance(filing_date, fiscal_year_end_month, fy_adjust):
     """
     Calculates the 8-K period label based on the month's distance from the fiscal year end.
@@ -730,6 +784,7 @@ def get_8k_period_label_by_distance(filing_date, fiscal_year_end_month, fy_adjus
 
 
 # --- Naming logic for 10-K/10-Q (based on report date) ---
+@lru_cache(maxsize=4096) # Pure apart from the clamp warning, which then prints once per distinct input
 def get_period_label_from_report_date(form, report_date, fiscal_year_end_month, fy_adjust):
     """
     Calculates the fiscal period (e.g., FY24, 1Q25) based on the report date
@@ -770,16 +825,37 @@ def get_period_label_from_report_date(form, report_date, fiscal_year_end_month,
         return f"FY{fiscal_year_label_year % 100:02d}"
 
 
+# --- SEC request pacing (shared by all worker threads) ---
+SEC_MAX_REQUESTS_PER_SECOND = 9 # Just under SEC's 10 req/s fair-access limit
+_request_times = deque() # time.monotonic() of each request started in the last second
+_request_times_lock = threading.Lock()
+
+def wait_for_request_slot():
+    """
+    Sliding-window rate limiter: blocks until fewer than SEC_MAX_REQUESTS_PER_SECOND requests
+    have started in the past second, then records this one. The lock is only held to update the
+    window; any sleep (and the request itself) happens outside it, so threads overlap their I/O.
+    """
+    while True:
+        with _request_times_lock:
+            now = time.monotonic()
+            while _request_times and now - _request_times[0] >= 1.0: _request_times.popleft()
+            if len(_request_times) < SEC_MAX_REQUESTS_PER_SECOND:
+                _request_times.append(now)
+                return
+            wait_time = 1.0 - (now - _request_times[0])
+        time.sleep(wait_time)
+
 # --- Robust GET with retries ---
-def robust_get(url, retries=5, delay=1, backoff=2, params=None): # Added params argument
+def robust_get(url, retries=5, delay=1, backoff=2, params=None, headers=None): # Added params/headers arguments
     """
     Performs a GET request with retries on 503/429 errors using exponential backoff.
     """
-    time.sleep(0.1) # Always have a small base delay to be polite
     current_delay = delay
     for attempt in range(retries):
         try:
-            resp = session.get(url, timeout=DEFAULT_TIMEOUT, params=params) 
+            wait_for_request_slot() # Every attempt counts against SEC's per-second budget
+            resp = session.get(url, timeout=DEFAULT_TIMEOUT, params=params, headers=headers) 
             resp.raise_for_status() 
             return resp 
         except requests.exceptions.HTTPError as e:
@@ -804,6 +880,120 @@ def robust_get(url, retries=5, delay=1, backoff=2, params=None): # Added params
     raise requests.exceptions.RequestException(f"Failed to get {url} after {retries} attempts.")
 
 
+# --- Persistent on-disk cache for SEC responses ---
+HTTP_CACHE_DIR = os.getenv('MZANSI_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'mzansi'))
+HTTP_CACHE_TTL = 86400 # Archive documents never change once filed
+SUBMISSIONS_CACHE_TTL = 3600 # The main submissions index gains new filings, so revalidate it hourly
+HTTP_CACHE_MAX_AGE = 30 * 86400 # Entries not fetched or revalidated for this long are deleted
+HTTP_CACHE_MAX_BYTES = 2 * 1024**3 # Past this total, least recently used entries are deleted
+HTTP_CACHE_PRUNE_INTERVAL = 3600 # Seconds between prunes (the first write after startup always prunes)
+_last_cache_prune = None # time.monotonic() of the last prune
+_cache_prune_lock = threading.Lock()
+
+def prune_http_cache():
+    """
+    Deletes <key>.bin/.meta pairs from HTTP_CACHE_DIR that are older than HTTP_CACHE_MAX_AGE, then
+    the least recently used pairs until HTTP_CACHE_MAX_BYTES fits. An entry's age is its newest
+    file's mtime (a 304 touches the .meta). Leftover .tmp files are deleted once stale.
+    """
+    cutoff = time.time() - HTTP_CACHE_MAX_AGE
+    entries = {} # cache_key -> [mtime, bytes]
+    try: names = os.listdir(HTTP_CACHE_DIR)
+    except OSError: return # Nothing cached yet
+    for name in names:
+        path = os.path.join(HTTP_CACHE_DIR, name)
+        try: info = os.stat(path)
+        except OSError: continue
+        cache_key, ext = os.path.splitext(name)
+        if ext == '.tmp':
+            if info.st_mtime < cutoff: # Left by a crashed write
+                try: os.remove(path)
+                except OSError: pass
+        elif ext in ('.bin', '.meta'):
+            entry = entries.setdefault(cache_key, [0.0, 0])
+            entry[0] = max(entry[0], info.st_mtime); entry[1] += info.st_size
+    total_bytes = sum(size for _, size in entries.values())
+    for cache_key, (mtime, size) in sorted(entries.items(), key=lambda item: item[1][0]):
+        if mtime >= cutoff and total_bytes <= HTTP_CACHE_MAX_BYTES: break
+        for ext in ('.meta', '.bin'): # Meta first: a body without meta is just refetched
+            try: os.remove(os.path.join(HTTP_CACHE_DIR, cache_key + ext))
+            except OSError: pass
+        total_bytes -= size
+
+def maybe_prune_http_cache():
+    """Runs prune_http_cache at most once per HTTP_CACHE_PRUNE_INTERVAL (called after cache writes)."""
+    global _last_cache_prune
+    with _cache_prune_lock:
+        now = time.monotonic()
+        if _last_cache_prune is not None and now - _last_cache_prune < HTTP_CACHE_PRUNE_INTERVAL: return
+        _last_cache_prune = now
+    prune_http_cache()
+
+def make_cached_response(url, content, headers):
+    """Builds a requests.Response around a cached body, so callers can use .content/.json()/.headers as usual."""
+    resp = requests.Response()
+    resp.status_code = 200
+    resp.url = url
+    resp._content = content
+    resp.headers = requests.structures.CaseInsensitiveDict(headers)
+    resp.encoding = requests.utils.get_encoding_from_headers(resp.headers)
+    return resp
+
+def cached_get(url, cache_ttl=HTTP_CACHE_TTL, **kwargs):
+    """
+    robust_get backed by a disk cache in HTTP_CACHE_DIR keyed by sha1(url): <key>.bin holds the
+    body (gzipped for JSON) and <key>.meta its ETag/Last-Modified/Content-Type. Within cache_ttl of
+    the last fetch or revalidation the cached body is returned without any request; after that a
+    conditional GET is sent and a 304 restarts the entry's TTL. Cache I/O errors are ignored.
+    """
+    cache_key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+    body_path = os.path.join(HTTP_CACHE_DIR, cache_key + '.bin')
+    meta_path = os.path.join(HTTP_CACHE_DIR, cache_key + '.meta')
+
+    meta = None; meta_age = None
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f: meta = json.load(f)
+        meta_age = time.time() - os.path.getmtime(meta_path)
+    except (OSError, ValueError): meta = None # No (readable) cache entry yet
+
+    def read_cached_response():
+        with open(body_path, 'rb') as f: body = f.read()
+        return make_cached_response(url, gzip.decompress(body) if meta.get('gzip') else body, meta.get('headers', {}))
+
+    if meta is not None and meta_age < cache_ttl:
+        try: return read_cached_response()
+        except (OSError, EOFError): meta = None # Body missing or damaged: refetch below
+
+    conditional_headers = {}
+    if meta is not None:
+        if meta.get('etag'): conditional_headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'): conditional_headers['If-Modified-Since'] = meta['last_modified']
+    r = robust_get(url, headers=conditional_headers or None, **kwargs)
+    if r.status_code == 304 and meta is not None:
+        try:
+            resp = read_cached_response()
+            os.utime(meta_path) # Revalidated: restart the TTL
+            return resp
+        except (OSError, EOFError):
+            r = robust_get(url, **kwargs) # Body evicted under us: fetch it again unconditionally
+
+    try:
+        os.makedirs(HTTP_CACHE_DIR, exist_ok=True)
+        content_type = r.headers.get('Content-Type', '')
+        compress = 'json' in content_type # Submissions JSON compresses ~10x; images/PDFs don't
+        # .bin and .meta each go via a .tmp file + os.replace: readers get old or new, never partial
+        tmp_suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(body_path + tmp_suffix, 'wb') as f: f.write(gzip.compress(r.content, compresslevel=6) if compress else r.content)
+        os.replace(body_path + tmp_suffix, body_path)
+        with open(meta_path + tmp_suffix, 'w', encoding='utf-8') as f:
+            json.dump({'url': url, 'etag': r.headers.get('ETag'), 'last_modified': r.headers.get('Last-Modified'),
+                       'gzip': compress, 'headers': {'Content-Type': content_type}}, f)
+        os.replace(meta_path + tmp_suffix, meta_path)
+    except OSError: pass
+    maybe_prune_http_cache()
+    return r
+
+
 # --- REWRITTEN Exhibit parsing for 8-K earnings release ---
 def get_earnings_release_exhibit_info(cik_padded, accession_clean, primary_doc_filename, archive_base_url, log_lines):
     """
@@ -815,7 +1005,7 @@ def get_earnings_release_exhibit_info(cik_padded, accession_clean, primary_doc_f
     log_lines.append(f"    Fetching primary 8-K document: {primary_doc_url}")
 
     try:
-        r_filing = robust_get(primary_doc_url, retries=2, delay=0.5)
+        r_filing = cached_get(primary_doc_url, retries=2, delay=0.5)
         if not r_filing:
             log_lines.append(f"    ERROR: Failed to fetch primary 8-K document {primary_doc_url} after retries.")
             return None
@@ -918,51 +1108,128 @@ def get_earnings_release_exhibit_info(cik_padded, accession_clean, primary_doc_f
 
 
 # --- Asset downloading ---
+@lru_cache(maxsize=64)
+def guess_extension(mime_type):
+    """Memoized mimetypes.guess_extension; assets in a filing repeat the same few content types."""
+    return mimetypes.guess_extension(mime_type)
+
+class AssetMemoryCache:
+    """
+    Thread-safe in-memory LRU of asset responses by URL, capped at max_bytes of body. Filings of
+    the same issuer reference the same logos/stylesheets, so each URL is fetched once and then
+    served from memory; concurrent requests for a URL being fetched wait for that fetch.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict() # absolute_url -> (content_type, body), least recently used first
+        self.total_bytes = 0
+        self.in_flight = {} # absolute_url -> Event set when its fetch finishes
+
+    def fetch(self, absolute_url):
+        """Returns (content_type, body) for absolute_url, or None if the fetch returned nothing."""
+        while True:
+            with self.lock:
+                entry = self.entries.get(absolute_url)
+                if entry is not None:
+                    self.entries.move_to_end(absolute_url)
+                    return entry
+                event = self.in_flight.get(absolute_url)
+                if event is None:
+                    event = self.in_flight[absolute_url] = threading.Event()
+                    break # This thread fetches it
+            event.wait() # Then re-check: the fetch may have failed, or been too big to keep
+        try:
+            r = cached_get(absolute_url)
+            if not r: return None
+            entry = (r.headers.get('content-type'), r.content)
+            if len(entry[1]) <= self.max_bytes:
+                with self.lock:
+                    self.entries[absolute_url] = entry
+                    self.total_bytes += len(entry[1])
+                    while self.total_bytes > self.max_bytes:
+                        _, (_, evicted_body) = self.entries.popitem(last=False)
+                        self.total_bytes -= len(evicted_body)
+            return entry
+        finally:
+            with self.lock: del self.in_flight[absolute_url]
+            event.set()
+
+asset_memory_cache = AssetMemoryCache(ASSET_CACHE_MAX_BYTES)
+
+def fetch_asset_file(absolute_url, safe_filename, filing_output_dir):
+    """
+    Downloads one asset into filing_output_dir (runs on an asset worker thread) and returns the
+    filename used, which may gain an extension guessed from the content type; None if the fetch
+    returned nothing. Exceptions propagate to download_assets, which logs them.
+    """
+    cached = asset_memory_cache.fetch(absolute_url)
+    if not cached: return None
+    content_type, body = cached
+    filenames = [safe_filename]
+    guessed_ext = guess_extension(content_type.split(';', 1)[0].strip()) if content_type else None
+    if guessed_ext and guessed_ext != ".asset" and not safe_filename.lower().endswith(guessed_ext.lower()):
+         filenames.insert(0, os.path.splitext(safe_filename)[0] + guessed_ext) # Preferred, if still free
+    for filename in filenames:
+        # 'xb' claims the name atomically, so two workers can never write the same file
+        try:
+            with open(os.path.join(filing_output_dir, filename), 'xb') as f: f.write(body)
+        except FileExistsError: continue
+        return filename
+    return safe_filename # Already present under the planned name
+
 def download_assets(soup, base_url, filing_output_dir, log_lines):
-    """Downloads CSS and image assets linked in the HTML."""
+    """
+    Downloads CSS and image assets linked in the HTML. Downloads overlap on the shared asset pool
+    (still paced by the SEC rate limiter); the soup is only read and modified on this thread.
+    """
     downloaded_assets_filenames = set()
-    processed_urls = set()
-    tags_and_attrs = [('img', 'src'), ('link', 'href')] 
-    for tag_name, url_attr in tags_and_attrs:
-        for tag in soup.find_all(tag_name):
-            if tag_name == 'link':
-                rel = tag.get('rel')
-                if not rel or 'stylesheet' not in rel: continue
-            asset_url = tag.get(url_attr)
-            if not asset_url or asset_url.startswith(('data:', 'javascript:')): continue
-            try:
-                absolute_url = urljoin(base_url, asset_url)
-                parsed_url = urlparse(absolute_url)
-            except ValueError:
-                log_lines.append(f"Warning: Skipping invalid asset URL: {asset_url}"); continue
-            if parsed_url.scheme not in ['http', 'https']: continue
-            if absolute_url in processed_urls: continue
-            processed_urls.add(absolute_url)
-            try:
-                path_part = parsed_url.path
-                filename_base = os.path.basename(path_part)
-                if not filename_base: filename_base = f"asset_{len(downloaded_assets_filenames) + 1}"
-                safe_filename = "".join(c if c.isalnum() or c in ['.', '_', '-'] else '_' for c in filename_base)[:100].strip('._')
-                if not safe_filename: safe_filename = f"asset_{len(downloaded_assets_filenames) + 1}"
-                _, ext = os.path.splitext(safe_filename)
-                if not ext: safe_filename += ".asset"
-                local_path = os.path.join(filing_output_dir, safe_filename)
-                if not os.path.exists(local_path):
-                    r = robust_get(absolute_url)
-                    if not r: continue
-                    content_type = r.headers.get('content-type')
-                    guessed_ext = mimetypes.guess_extension(content_type.split(';')[0]) if content_type else None
-                    if guessed_ext and guessed_ext != ".asset" and not safe_filename.lower().endswith(guessed_ext.lower()):
-                         base, _ = os.path.splitext(safe_filename)
-                         new_safe_filename = base + guessed_ext
-                         new_local_path = os.path.join(filing_output_dir, new_safe_filename)
-                         if not os.path.exists(new_local_path):
-                             safe_filename = new_safe_filename
-                             local_path = new_local_path
-                    with open(local_path, 'wb') as f: f.write(r.content)
-                tag[url_attr] = safe_filename
-                downloaded_assets_filenames.add(safe_filename)
-            except Exception as e: log_lines.append(f"Warn: Error with asset {absolute_url}: {e}")
+    planned_downloads = {} # absolute_url -> safe filename it will be saved as
+    url_for_filename = {} # safe filename -> absolute_url that downloads it
+    tags_by_url = defaultdict(list) # downloading absolute_url -> [(tag, url_attr)] to rewrite
+    url_attr_by_tag = {'img': 'src', 'link': 'href'}
+    # --- Phase 1: resolve URLs and plan filenames (no network) ---
+    # One walk of the tree for both tag kinds (find_all per tag name walked it once each)
+    for tag in soup.find_all(list(url_attr_by_tag)):
+        url_attr = url_attr_by_tag[tag.name]
+        if tag.name == 'link':
+            rel = tag.get('rel')
+            if not rel or 'stylesheet' not in rel: continue
+        asset_url = tag.get(url_attr)
+        if not asset_url or asset_url.startswith(('data:', 'javascript:')): continue
+        try:
+            absolute_url = urljoin(base_url, asset_url)
+            parsed_url = urlparse(absolute_url)
+        except ValueError:
+            log_lines.append(f"Warning: Skipping invalid asset URL: {asset_url}"); continue
+        if parsed_url.scheme not in ['http', 'https']: continue
+        if absolute_url not in planned_downloads:
+            path_part = parsed_url.path
+            filename_base = os.path.basename(path_part)
+            if not filename_base: filename_base = f"asset_{len(planned_downloads) + 1}"
+            safe_filename = _UNSAFE_ASSET_CHARS_RE.sub('_', filename_base)[:100].strip('._')
+            if not safe_filename: safe_filename = f"asset_{len(planned_downloads) + 1}"
+            _, ext = os.path.splitext(safe_filename)
+            if not ext: safe_filename += ".asset"
+            # Name already planned for a different URL: these tags reuse that URL's download
+            absolute_url = url_for_filename.setdefault(safe_filename, absolute_url)
+            planned_downloads.setdefault(absolute_url, safe_filename)
+        tags_by_url[absolute_url].append((tag, url_attr))
+
+    # --- Phase 2: download concurrently ---
+    futures = {asset_executor.submit(fetch_asset_file, absolute_url, safe_filename, filing_output_dir): absolute_url
+               for absolute_url, safe_filename in planned_downloads.items()}
+    for future in as_completed(futures):
+        absolute_url = futures[future]
+        try:
+            safe_filename = future.result()
+        except Exception as e:
+            log_lines.append(f"Warn: Error with asset {absolute_url}: {e}"); continue
+        if not safe_filename: continue
+        # --- Phase 3: point the tags at the local file (this thread only) ---
+        for tag, url_attr in tags_by_url[absolute_url]:
+            tag[url_attr] = safe_filename
+        downloaded_assets_filenames.add(safe_filename)
     return list(downloaded_assets_filenames)
 
 # --- Clean internal anchor links ---
@@ -977,7 +1244,89 @@ def clean_internal_links(soup, log_lines):
     return soup
 
 # --- HTML to PDF conversion ---
-def convert_generic_to_pdf(html_path, output_filename_base, accession, log_lines) -> Tuple[Optional[str], Optional[str]]:
+def render_pdf_weasyprint(html_bytes, base_dir, pdf_path, accession, log_lines) -> bool:
+    """
+    Renders the (UTF-8) HTML bytes to pdf_path in-process with WeasyPrint, resolving relative asset
+    links against base_dir. Returns False (logged) on failure.
+    """
+    try:
+        WeasyHTML(string=html_bytes, encoding='utf-8', base_url=base_dir).write_pdf(
+            pdf_path, stylesheets=[weasyprint_page_css], font_config=weasyprint_font_config, zoom=PDF_CONTENT_ZOOM,
+            optimize_images=True)
+        return True
+    except Exception as e_wp:
+        log_lines.append(f"Warning: WeasyPrint PDF error for {accession}: {e_wp}. Falling back to Chrome.")
+        if os.path.exists(pdf_path): os.remove(pdf_path)
+        return False
+
+class ChromeRenderer:
+    """
+    One headless Chrome kept running for the life of the server instead of a launch per filing.
+    Playwright's sync API only works on the thread that started it, so a dedicated thread owns the
+    browser and prints queued jobs one at a time (a fresh page each). If the thread dies, the next
+    render starts a new one; a disconnected browser is relaunched on the next job.
+    """
+    def __init__(self):
+        self.jobs = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def _ensure_thread(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name="chrome-render", daemon=True)
+                self.thread.start()
+
+    def render(self, file_uri, pdf_path):
+        """Prints file_uri to pdf_path (blocking). Re-raises the render error."""
+        job = {"file_uri": file_uri, "pdf_path": pdf_path, "done": threading.Event(), "error": None}
+        self._ensure_thread()
+        self.jobs.put(job)
+        while not job["done"].wait(timeout=1.0):
+            self._ensure_thread() # Render thread died with our job still queued: start another
+        if job["error"] is not None: raise job["error"]
+
+    def close(self):
+        """Stops the render thread, closing the browser (registered with atexit)."""
+        if self.thread is not None and self.thread.is_alive():
+            self.jobs.put(None)
+            self.thread.join(timeout=10)
+
+    def _run(self):
+        try:
+            with sync_playwright() as p:
+                browser = None
+                while True:
+                    job = self.jobs.get()
+                    if job is None: break
+                    try:
+                        if browser is None or not browser.is_connected():
+                            browser = p.chromium.launch(headless=True, executable_path=get_chrome_path())
+                        page = browser.new_page()
+                        try:
+                            page.goto(job["file_uri"], wait_until='networkidle', timeout=90000)
+                            page.wait_for_timeout(2000); page.emulate_media(media='print')
+                            page.pdf(path=job["pdf_path"], format='Letter', print_background=True, margin={'top': '1cm', 'bottom': '1cm', 'left': '1cm', 'right': '1cm'}, prefer_css_page_size=True, scale=PDF_CONTENT_ZOOM)
+                        finally: page.close()
+                    except Exception as e: job["error"] = e
+                    finally: job["done"].set()
+                if browser is not None and browser.is_connected(): browser.close()
+        except Exception as e:
+            # Playwright itself failed to start/stop: fail the waiting jobs rather than hang them
+            print(f"Error: Chrome render thread stopped: {e}", file=sys.stderr)
+            while True:
+                try: job = self.jobs.get_nowait()
+                except queue.Empty: break
+                if job is not None: job["error"] = e; job["done"].set()
+
+chrome_renderer = ChromeRenderer()
+atexit.register(chrome_renderer.close)
+
+def convert_generic_to_pdf(html_path, html_bytes, output_filename_base, accession, log_lines) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Renders html_bytes (whose assets sit next to html_path) to a PDF beside html_path. WeasyPrint
+    renders from memory; html_path is only written when Chrome has to load the page from disk.
+    """
     pdf_path = None; pdf_filename = None
     try:
         safe_base_name = "".join(c if c.isalnum() or c in ['_', '-'] else '_' for c in output_filename_base).strip('._')
@@ -986,20 +1335,15 @@ def convert_generic_to_pdf(html_path, output_filename_base, accession, log_lines
         pdf_path = os.path.join(os.path.dirname(html_path), pdf_filename)
         abs_html_path = os.path.abspath(html_path); file_uri = pathlib.Path(abs_html_path).as_uri()
         log_lines.append(f"Attempting PDF: {pdf_filename}")
-        chrome_exec = get_chrome_path()
-        if not chrome_exec: log_lines.append("ERROR: Chrome not found."); return None, None
-        with sync_playwright() as p:
-            browser = None
+        rendered = PDF_ENGINE == 'weasyprint' and render_pdf_weasyprint(html_bytes, os.path.dirname(abs_html_path), pdf_path, accession, log_lines)
+        if not rendered:
+            chrome_exec = get_chrome_path()
+            if not chrome_exec: log_lines.append("ERROR: Chrome not found."); return None, None
+            with open(html_path, 'wb') as f: f.write(html_bytes)
             try:
-                browser = p.chromium.launch(headless=True, executable_path=chrome_exec)
-                page = browser.new_page()
-                page.goto(file_uri, wait_until='networkidle', timeout=90000)
-                page.wait_for_timeout(2000); page.emulate_media(media='print')
-                page.pdf(path=pdf_path, format='Letter', print_background=True, margin={'top': '1cm', 'bottom': '1cm', 'left': '1cm', 'right': '1cm'}, prefer_css_page_size=True, scale=0.8)
-                browser.close()
+                chrome_renderer.render(file_uri, pdf_path) # Shared browser; no launch per filing
             except Exception as e_pw:
                  log_lines.append(f"ERROR: Playwright PDF error for {accession}: {e_pw}")
-                 if browser and browser.is_connected(): browser.close()
                  if pdf_path and os.path.exists(pdf_path): os.remove(pdf_path)
                  return None, None
         if os.path.exists(pdf_path) and os.path.getsize(pdf_path) > 100:
@@ -1032,19 +1376,22 @@ def download_and_process_generic(target_url, form, accession, cik, ticker, outpu
     log_prefix = f"[{accession} {form}]"; cleanup_flag = True
     try:
         log_lines.append(f"{log_prefix} Processing in {os.path.basename(filing_output_dir)} for {target_url}")
-        r = robust_get(target_url) # Use robust_get to handle rate limiting
+        r = cached_get(target_url) # robust_get (rate limiting, retries) behind the disk cache
         if not r:
             raise Exception(f"Failed to download {target_url} after multiple retries.")
             
         base_html_filename = f"{output_filename_base}_{accession}.htm"
         html_path = os.path.join(filing_output_dir, base_html_filename)
-        try: decoded_text = r.content.decode('utf-8')
-        except UnicodeDecodeError:
-             try: decoded_text = r.content.decode('latin-1')
-             except UnicodeDecodeError: decoded_text = r.content.decode('utf-8', errors='replace'); log_lines.append(f"{log_prefix} Warn: UTF-8 with replacement.")
-        replacements = { "Â\x9d": "\"", "â€œ": "\"", "â€™": "'", "â€˜": "'", "â€“": "-", "â€”": "—", "&nbsp;": " ", "\u00a0": " " }
-        for wrong, correct in replacements.items(): decoded_text = decoded_text.replace(wrong, correct)
-        soup = BeautifulSoup(decoded_text, 'html.parser')
+        try: decoded_text = r.content.decode('utf-8') # Nearly all filings; no detection needed
+        except UnicodeDecodeError: # Legacy codepage (usually cp1252): let charset-normalizer guess it
+            best_match = charset_from_bytes(r.content).best()
+            decoded_text = r.content.decode(best_match.encoding if best_match else 'utf-8', errors='replace')
+        decoded_text = _MOJIBAKE_RE.sub(lambda m: _MOJIBAKE[m.group(0)], decoded_text)
+        # lxml's C parser is far faster than html.parser on multi-MB filings; fall back if it isn't installed
+        try:
+            soup = BeautifulSoup(decoded_text, 'lxml')
+        except Exception:
+            soup = BeautifulSoup(decoded_text, 'html.parser')
         head = soup.head
         if not head: head = soup.new_tag('head'); (soup.find('html') or soup).insert(0, head)
         if not head.find('meta', charset=True): head.insert(0, soup.new_tag('meta', charset='UTF-8'))
@@ -1053,10 +1400,15 @@ def download_and_process_generic(target_url, form, accession, cik, ticker, outpu
             if not p_tag.get_text(strip=True) and not p_tag.find(['img', 'table', 'svg', 'hr']):
                 p_tag.decompose(); cleaned_p_count += 1
         if cleaned_p_count > 0: log_lines.append(f"{log_prefix} Removed {cleaned_p_count} empty paragraphs.")
+        # Filings are static documents: drop <script> blocks so Chromium neither fetches nor runs them
+        # (and networkidle isn't held up by script-driven requests)
+        for script_tag in soup.find_all('script'): script_tag.decompose()
         if 'clean_internal_links' in globals(): soup = clean_internal_links(soup, log_lines)
         doc_base_url = urljoin(target_url, '.'); downloaded_assets = download_assets(soup, doc_base_url, filing_output_dir, log_lines)
-        with open(html_path, 'w', encoding='utf-8') as f: f.write(str(soup))
-        pdf_path, generated_pdf_basename = convert_generic_to_pdf(html_path, output_filename_base, accession, log_lines)
+        # Minimal formatter: only escapes what must be escaped, straight to UTF-8 bytes
+        html_bytes = soup.encode('utf-8', formatter='minimal')
+        del soup # Free the parse tree before rendering
+        pdf_path, generated_pdf_basename = convert_generic_to_pdf(html_path, html_bytes, output_filename_base, accession, log_lines)
         return (form, pdf_path, generated_pdf_basename)
     except Exception as e:
         log_lines.append(f"{log_prefix} ERROR processing {target_url}: {e} {traceback.format_exc(limit=1)}")
@@ -1076,9 +1428,9 @@ def process_filing(cik, ticker, fy_month_str, fy_adjust, log_lines, tmp_dir, lat
     archive_base_url = f"https://www.sec.gov/Archives/edgar/data/{cik_padded}/"
     log_lines.append(f"Accessing EDGAR index for CIK: {cik_padded}...")
     try:
-        r = robust_get(submissions_url, retries=3, delay=0.5)
+        r = cached_get(submissions_url, cache_ttl=SUBMISSIONS_CACHE_TTL, retries=3, delay=0.5)
         if not r: log_lines.append(f"ERROR: Failed to retrieve submission data."); return pdf_files, report_items, log_lines
-        submissions = r.json()
+        submissions = json_loads(r.content)
         log_lines.append("Successfully retrieved submission data.")
         if not ticker and 'tickers' in submissions and submissions['tickers']:
              ticker = submissions['tickers'][0]; log_lines.append(f"Note: Using ticker '{ticker}' from SEC data.")
@@ -1103,14 +1455,15 @@ def process_filing(cik, ticker, fy_month_str, fy_adjust, log_lines, tmp_dir, lat
 
             with ThreadPoolExecutor(max_workers) as executor:
                 future_to_url = {
-                    executor.submit(robust_get, f"https://data.sec.gov/submissions/{file_info['name']}"): file_info['name']
+                    # Each historical shard is cached on its own (older filings only, so the long TTL is safe)
+                    executor.submit(cached_get, f"https://data.sec.gov/submissions/{file_info['name']}"): file_info['name']
                     for file_info in historical_files_to_fetch
                 }
                 for i, future in enumerate(as_completed(future_to_url)):
                     url_name = future_to_url[future]
                     try:
                         resp = future.result()
-                        all_filing_sources.append(resp.json())
+                        all_filing_sources.append(json_loads(resp.content))
                     except Exception as exc:
                         log_lines.append(f'Warn: Failed to fetch historical file {url_name}: {exc}')
                     finally:
@@ -1127,7 +1480,11 @@ def process_filing(cik, ticker, fy_month_str, fy_adjust, log_lines, tmp_dir, lat
              return pdf_files, report_items, log_lines
         
         with progress_lock: progress_data["text"] = "Aggregating all filing data..."
-        
+
+        # Only rows of forms this mode uses get parsed into dicts (amendments like 10-K/A included)
+        wanted_base_forms = {'8K_Earnings': {'8-K'}, '10K_10Q': {'10-K', '10-Q'}}.get(fetch_mode)
+        form_is_wanted = {} # raw form -> bool; a few distinct values repeat across thousands of rows
+
         for source_data in all_filing_sources:
             if not source_data: continue
             accession_numbers = source_data.get('accessionNumber', [])
@@ -1144,18 +1501,25 @@ def process_filing(cik, ticker, fy_month_str, fy_adjust, log_lines, tmp_dir, lat
                  continue
             if len(items_list) < list_len: items_list.extend([''] * (list_len - len(items_list)))
 
-            for i in range(list_len):
+            # One tuple unpack per row instead of indexing seven parallel lists
+            rows = zip(accession_numbers, forms, filing_dates_str_list, report_dates_str_list, primary_documents, items_list, acceptance_datetimes)
+            for accession_raw, form, filing_date_str, report_date_str, primary_doc, items, acceptance_datetime_str in rows:
+                if wanted_base_forms is not None:
+                    wanted = form_is_wanted.get(form)
+                    if wanted is None: wanted = form_is_wanted[form] = form.split('/')[0] in wanted_base_forms
+                    if not wanted: continue
                 try:
-                    filing_dt = datetime.strptime(filing_dates_str_list[i], "%Y-%m-%d").date()
-                    report_dt = datetime.strptime(report_dates_str_list[i], "%Y-%m-%d").date() if report_dates_str_list[i] else None
+                    # EDGAR dates are plain YYYY-MM-DD: fromisoformat is much cheaper than strptime
+                    filing_dt = date.fromisoformat(filing_date_str)
+                    report_dt = date.fromisoformat(report_date_str) if report_date_str else None
                     all_filings_raw.append({
-                        "accession_raw": accession_numbers[i], "accession_clean": accession_numbers[i].replace('-', ''),
-                        "form": forms[i], "filing_date": filing_dt, "filing_date_str": filing_dates_str_list[i],
-                        "acceptance_datetime_str": acceptance_datetimes[i], 
-                        "report_date": report_dt, "report_date_str": report_dates_str_list[i],
-                        "primary_doc": primary_documents[i], "items": items_list[i]
+                        "accession_raw": accession_raw, "accession_clean": accession_raw.replace('-', ''),
+                        "form": form, "filing_date": filing_dt, "filing_date_str": filing_date_str,
+                        "acceptance_datetime_str": acceptance_datetime_str,
+                        "report_date": report_dt, "report_date_str": report_date_str,
+                        "primary_doc": primary_doc, "items": items
                     })
-                except ValueError as e: log_lines.append(f"Warn: Skipping {accession_numbers[i]}, date error: {e}")
+                except ValueError as e: log_lines.append(f"Warn: Skipping {accession_raw}, date error: {e}")
 
         seen_accessions = set()
         deduped_filings = []
@@ -1166,7 +1530,7 @@ def process_filing(cik, ticker, fy_month_str, fy_adjust, log_lines, tmp_dir, lat
         
         all_filings_raw = deduped_filings
         all_filings_raw.sort(key=lambda x: x['filing_date']) 
-        log_lines.append(f"Processing a complete set of {len(all_filings_raw)} filings...")
+        log_lines.append(f"Processing a complete set of {len(all_filings_raw)} relevant filings...")
         
         tasks_to_submit = []
         EARLIEST_FISCAL_YEAR_SUFFIX = 17 
@@ -1384,16 +1748,19 @@ def create_zip_archive(pdf_files, cik, log_lines, tmp_dir):
     log_lines.append(f"Creating ZIP: '{zip_filename}'...")
     added_count = 0
     try:
-        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        # PDFs are already Flate/JPEG-compressed, so DEFLATE gains ~1-3% for a full CPU pass: store them
+        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_STORED, allowZip64=True) as zipf:
             folder_map = {"10-K": "10-K", "10-Q": "10-Q", "8-K_ER": "8-K Earnings Release"}
             for form_key, folder_name in folder_map.items():
                  paths = pdf_files.get(form_key, [])
                  if not paths: continue
                  paths.sort() 
+                 # Paths only come back from convert_generic_to_pdf after it checked the file, so no stat here
                  for pdf_full_path in paths:
-                      if pdf_full_path and os.path.exists(pdf_full_path):
-                          zipf.write(pdf_full_path, arcname=os.path.join(folder_name, os.path.basename(pdf_full_path)))
-                          added_count += 1
+                      if not pdf_full_path: continue
+                      try: zipf.write(pdf_full_path, arcname=os.path.join(folder_name, os.path.basename(pdf_full_path)))
+                      except FileNotFoundError: log_lines.append(f"Warn: PDF vanished before zipping: {pdf_full_path}"); continue
+                      added_count += 1
         log_lines.append(f"ZIP created with {added_count} files.")
         return zip_path, log_lines
     except Exception as e:
@@ -1460,10 +1827,14 @@ def create_download_report_csv(report_items: List[Dict[str, str]], cik: str, tmp
         return None, log_lines
 
 # --- Flask Routes ---
+# render_template_string recompiles the template source on every call; compile the form page once
+# (url_for is a jinja_env global, so the compiled template renders the same inside a request).
+FORM_PAGE = app.jinja_env.from_string(FORM_TEMPLATE)
+MONTH_CHOICES = [(str(i), calendar.month_name[i]) for i in range(1, 13)]
+
 @app.route("/", methods=["GET"])
 def index():
-    months = [(str(i), datetime(2000, i, 1).strftime('%B')) for i in range(1, 13)]
-    return render_template_string(FORM_TEMPLATE, months=months)
+    return FORM_PAGE.render(months=MONTH_CHOICES)
 
 @app.route("/fetch", methods=["POST"])
 def fetch_filing():
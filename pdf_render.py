@@ -0,0 +1,130 @@
+# pdf_render.py
+# WeasyPrint rendering for streamlit_app.py, kept in its own importable module so it can run in a
+# ProcessPoolExecutor: rendering is CPU-bound and holds the GIL, and a function defined inside the
+# Streamlit script can't be pickled by reference (the script isn't an importable module). Spawned
+# workers do still execute streamlit_app.py once at startup, as __mp_main__, before rendering.
+import os
+import signal
+import hashlib
+import logging
+from weasyprint import HTML, CSS, __version__ as WEASYPRINT_VERSION
+from weasyprint.text.fonts import FontConfiguration
+from weasyprint.logger import LOGGER as weasyprint_logger
+
+# Optional: Set WeasyPrint logging level (e.g., to ERROR to reduce noise)
+weasyprint_logger.setLevel(logging.ERROR)
+
+PDF_JPEG_QUALITY = 80 # Re-encode quality for embedded JPEGs (with optimize_images)
+APP_DIR_URL = 'file://' + os.path.dirname(os.path.abspath(__file__)) + '/'
+
+# --- PDF styling: page margins, EB Garamond font, and page numbers ---
+# IMPORTANT: Assumes 'EBGaramond-Regular.ttf' (or similar) is in a 'fonts' subdirectory.
+#            Verify the filename and adjust the url() path if needed.
+STYLING_CSS_STRING = """
+    /* Embed the EB Garamond font */
+    @font-face {
+        font-family: "EB Garamond";
+        /* Verify this filename matches the font file you added */
+        src: url('fonts/EBGaramond-Regular.ttf') format('truetype');
+        font-weight: normal;
+        font-style: normal;
+    }
+    /* You might need additional @font-face rules for Bold, Italic, etc. if used */
+    /* e.g., src: url('fonts/EBGaramond-Bold.ttf'); font-weight: bold; */
+
+    /* Define page layout */
+    @page {
+        margin-top: 0.8cm; /* Keep reduced top margin */
+        margin-bottom: 1.5cm; /* Keep margin for footer */
+        margin-left: 1cm;
+        margin-right: 1cm;
+
+        /* Add page number in the bottom center using EB Garamond */
+        @bottom-center {
+            content: "Page " counter(page) " of " counter(pages);
+            font-family: "EB Garamond", serif; /* Use EB Garamond */
+            font-size: 9pt;
+            color: #555;
+            vertical-align: top;
+            padding-top: 5mm;
+        }
+    }
+
+    /* Set base body font to EB Garamond */
+    body {
+        font-family: "EB Garamond", serif; /* Use EB Garamond, fallback to generic serif */
+        font-size: 11pt;   /* Adjust base font size as needed */
+        line-height: 1.3;
+    }
+
+    /* Optional: Basic table styling */
+    table {
+        border-collapse: collapse;
+        width: 100%;
+        margin-top: 0.5em;
+        margin-bottom: 0.5em;
+     }
+    th, td {
+        border: 1px solid #ccc;
+        padding: 4px 6px;
+        text-align: left;
+        vertical-align: top;
+    }
+    th {
+         background-color: #f2f2f2;
+         font-weight: bold;
+    }
+    """
+
+# Identifies what a render looks like (WeasyPrint version, image quality, stylesheet); streamlit_app
+# keys its rendered-PDF cache on it, so changing any of these invalidates cached PDFs.
+RENDER_FINGERPRINT = hashlib.sha1(
+    f"{WEASYPRINT_VERSION}|{PDF_JPEG_QUALITY}|{STYLING_CSS_STRING}".encode('utf-8')).hexdigest()[:12]
+
+# Parsed CSS and font configuration, built once per process on first use and reused for every
+# filing that process renders (these objects can't be pickled across processes).
+_styling = None
+
+def get_styling():
+    """Returns (styling_css, font_config) for the current process, building them on first call."""
+    global _styling
+    if _styling is None:
+        font_config = FontConfiguration()
+        # base_url makes url('fonts/...') resolve against the app directory rather than each filing's temp dir
+        styling_css = CSS(string=STYLING_CSS_STRING, font_config=font_config, base_url=APP_DIR_URL)
+        _styling = (styling_css, font_config)
+    return _styling
+
+class RenderTimeout(Exception):
+    """Raised by render_pdf when a render runs longer than its timeout."""
+
+def _raise_render_timeout(signum, frame):
+    raise RenderTimeout()
+
+def render_pdf(html_bytes, base_url, pdf_path=None, timeout=None):
+    """
+    Renders HTML (UTF-8 bytes) to PDF bytes with the shared styling. Relative links
+    (downloaded assets) resolve against base_url. If pdf_path is given, a copy is also written there.
+    If timeout (seconds) is given, the render is abandoned with RenderTimeout once it has run that
+    long, which frees the worker process for the next filing. The clock starts here, in the worker, so
+    time spent queued in the pool doesn't count (needs SIGALRM; elsewhere the timeout is ignored).
+    Exceptions propagate to the caller (re-raised from Future.result() when run in a pool).
+    """
+    use_alarm = timeout and hasattr(signal, 'SIGALRM')
+    if use_alarm:
+        previous_handler = signal.signal(signal.SIGALRM, _raise_render_timeout)
+        signal.alarm(int(timeout))
+    try:
+        styling_css, font_config = get_styling()
+        # optimize_images re-encodes embedded rasters (logos, scanned exhibits) and strips their metadata;
+        # presentational_hints stays at its default (False), so legacy bgcolor/width attributes add no cascade pass
+        # encoding is given explicitly: documents without a charset <meta> would otherwise be sniffed
+        pdf_bytes = HTML(string=html_bytes, base_url=base_url, encoding='utf-8').write_pdf(
+            stylesheets=[styling_css], font_config=font_config, optimize_images=True, jpeg_quality=PDF_JPEG_QUALITY)
+    finally:
+        if use_alarm:
+            signal.alarm(0)
+            signal.signal(signal.SIGALRM, previous_handler)
+    if pdf_path:
+        with open(pdf_path, 'wb') as f: f.write(pdf_bytes)
+    return pdf_bytes
@@ -1,33 +1,58 @@
 # streamlit_app.py
 import os
+import re
 import sys
 import requests
+from charset_normalizer import from_bytes as charset_from_bytes
+import shutil
 import tempfile
+import threading
 import zipfile
 import time
+import calendar
+import codecs
+import hashlib
+import json
 import mimetypes # For guessing asset types
 import traceback # For detailed error logging
+from collections import defaultdict, deque
+from functools import lru_cache
 from datetime import datetime
 from io import BytesIO
 from urllib.parse import urlparse, urljoin
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import streamlit as st
 
 # Ensure necessary libraries are installed
 # These should be in your requirements.txt for Streamlit Cloud
 try:
-    from bs4 import BeautifulSoup
+    # lxml parses filing HTML in C (libxml2), several times faster than a pure-Python parser on large 10-Ks
+    import lxml.html
+    from lxml import etree
 except ModuleNotFoundError:
-    st.error("Error: `beautifulsoup4` not found. Please add it to requirements.txt")
+    st.error("Error: `lxml` not found. Please add it to requirements.txt")
     st.stop()
+# orjson parses the multi-MB submissions JSON several times faster than the stdlib; optional
+try:
+    from orjson import loads as json_loads
+except ModuleNotFoundError:
+    from json import loads as json_loads
+
+# Optional headless-Chromium fallback for filings WeasyPrint can't lay out in time (needs `playwright`
+# plus `playwright install chromium`; not part of the Streamlit Cloud deploy, so it's skipped when absent)
+try:
+    from playwright.sync_api import sync_playwright
+except ModuleNotFoundError:
+    sync_playwright = None
 
 # --- Use WeasyPrint instead of xhtml2pdf ---
 try:
-    from weasyprint import HTML, CSS
-    from weasyprint.logger import LOGGER as weasyprint_logger
-    import logging
-    # Optional: Set WeasyPrint logging level (e.g., to ERROR to reduce noise)
-    weasyprint_logger.setLevel(logging.ERROR)
+    # pdf_render imports WeasyPrint and holds the stylesheet; it runs in worker processes (see get_render_pool)
+    import pdf_render
 except ModuleNotFoundError:
     st.error("Error: `weasyprint` not found. Please add it to requirements.txt")
     st.stop()
@@ -43,31 +68,231 @@ except Exception as e:
 # -------------------------
 HEADERS = {
     # User agent includes contact info as requested by SEC best practices
-    'User-Agent': 'Mzansi EDGAR Viewer v2.3 (support@example.com)' # Version bump
+    'User-Agent': 'Mzansi EDGAR Viewer v2.3 (support@example.com)', # Version bump
+    'Accept-Encoding': 'gzip, deflate' # SEC serves compressed JSON/HTML; submissions JSON shrinks ~10x on the wire
 }
 
-session = requests.Session()
-session.headers.update(HEADERS)
 DEFAULT_TIMEOUT = 20  # Timeout for individual HTTP requests in seconds
+RATE_LIMIT_RETRIES = 3  # Retries for 429 responses (each retry goes back through the rate limiter)
+RATE_LIMIT_BACKOFF = 1.0  # Seconds before the first 429 retry when there is no Retry-After; doubles each time
+RATE_LIMIT_MAX_WAIT = 60  # Upper bound in seconds on any single 429 wait
+DOWNLOAD_CHUNK_SIZE = 64 * 1024  # Bytes per read when streaming asset downloads to disk
+# Primary filing documents are kept here across runs and revalidated with ETag/Last-Modified
+HTTP_CACHE_DIR = os.path.join(tempfile.gettempdir(), "mzansi_http_cache")
+PDF_CACHE_DIR = os.path.join(tempfile.gettempdir(), "mzansi_pdf_cache") # Rendered PDFs, keyed by accession and render settings
+HTTP_CACHE_MAX_AGE = 14 * 86400  # Seconds; HTTP cache files not used for this long are removed
+HTTP_CACHE_MAX_BYTES = 2 * 1024**3  # Beyond this total, the least recently used HTTP cache files are removed
+PDF_CACHE_VERSION = 1  # Bump when HTML preprocessing changes, so previously cached PDFs aren't reused
+PDF_CACHE_MAX_AGE = 30 * 86400  # Seconds; cached PDFs older than this are removed
+PDF_CACHE_MAX_BYTES = 1024**3  # Beyond this total, the oldest cached PDFs are removed
+CACHE_PRUNE_INTERVAL = 3600  # Seconds between cache directory prunes
+ASSET_DOWNLOAD_WORKERS = 8  # Concurrent asset downloads within a single filing
+FILING_DOWNLOAD_WORKERS = 8  # Filings downloaded/parsed concurrently (threads; network-bound)
+HTTP_POOL_MAXSIZE = FILING_DOWNLOAD_WORKERS + ASSET_DOWNLOAD_WORKERS + 1  # Keep-alive connections per host
+PDF_RENDER_WORKERS = os.cpu_count() or 1  # WeasyPrint processes (CPU-bound, so one per core)
+PDF_RENDER_TIMEOUT = 90  # Seconds of WeasyPrint rendering before trying the Chromium fallback (large 10-Ks take tens of seconds)
+PDF_RENDER_TIMEOUT_GRACE = 30  # Extra seconds before a worker that ignored its own timeout is killed
+
+@st.cache_resource
+def get_session():
+    """
+    Returns the process-wide requests.Session. Streamlit re-executes this script on every
+    interaction, so the session (and its pooled keep-alive connections) lives in cache_resource
+    rather than being rebuilt per rerun.
+    """
+    http_session = requests.Session()
+    http_session.headers.update(HEADERS)
+    # Per-host pool sized for every thread that can be mid-request at once (all filing workers, all
+    # asset workers, plus the script thread fetching submissions), so no keep-alive connection is
+    # discarded and re-handshaked. Transient 5xx responses on GET/HEAD are retried with backoff.
+    # 429 is left out: urllib3's retries would skip the rate limiter, so rate_limited_get retries it.
+    retry_policy = Retry(total=3, backoff_factor=0.2, status_forcelist=[500, 502, 503, 504],
+                         allowed_methods=["GET", "HEAD"])
+    adapter = HTTPAdapter(pool_connections=16, pool_maxsize=HTTP_POOL_MAXSIZE, max_retries=retry_policy)
+    http_session.mount('https://', adapter)
+    http_session.mount('http://', adapter) # Older filings occasionally link assets over plain http
+    return http_session
+
+session = get_session()
+
+class RateLimiter:
+    """
+    Process-wide token bucket for SEC EDGAR requests (SEC asks for at most 10 requests/second).
+    capacity caps the burst after an idle spell: with one token, any one-second window sees at most
+    rate + 1 requests. acquire() blocks until a token is available; the lock only guards the token
+    arithmetic, never the sleep, so waiting threads don't serialize each other.
+    """
+    def __init__(self, rate=9.0, capacity=1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = self.capacity
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+                self.last_refill = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+@st.cache_resource
+def get_rate_limiter():
+    """Returns the single RateLimiter shared by every rerun, session and worker thread."""
+    return RateLimiter(rate=9.0, capacity=1.0)
+
+rate_limiter = get_rate_limiter()
+
+def rate_limited_get(url, **kwargs):
+    """
+    session.get behind the rate limiter. A 429 (Too Many Requests) is retried up to
+    RATE_LIMIT_RETRIES times; each retry waits out Retry-After (in seconds, else an exponential
+    backoff) and then takes a fresh limiter token. Returns the last response.
+    """
+    for attempt in range(RATE_LIMIT_RETRIES + 1):
+        rate_limiter.acquire()
+        r = session.get(url, **kwargs)
+        if r.status_code != 429 or attempt == RATE_LIMIT_RETRIES:
+            return r
+        retry_after = r.headers.get('Retry-After', '').strip()
+        r.close()
+        wait = int(retry_after) if retry_after.isdigit() else RATE_LIMIT_BACKOFF * 2 ** attempt
+        time.sleep(min(wait, RATE_LIMIT_MAX_WAIT))
+
+@st.cache_resource
+def get_render_pool():
+    """
+    Returns the process pool that runs pdf_render.render_pdf. Kept alive across reruns so worker
+    processes (and their parsed stylesheet) are reused. 'spawn' avoids forking this multi-threaded
+    process. Note that a spawned worker still re-runs this script once at startup (as __mp_main__,
+    outside any Streamlit session, so no widget fires and no filing is processed) before it
+    unpickles pdf_render.render_pdf; after that it only renders.
+    """
+    return ProcessPoolExecutor(max_workers=PDF_RENDER_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+
+@st.cache_resource
+def get_render_slots():
+    """
+    Returns the semaphore that caps in-flight renders at the pool size. A filing takes a slot
+    before submitting, so its job never waits inside the pool and starts on an idle worker right away.
+    """
+    return threading.BoundedSemaphore(PDF_RENDER_WORKERS)
+
+@st.cache_resource
+def get_render_pool_lock():
+    """Returns the lock that serializes swapping in a new render pool."""
+    return threading.Lock()
+
+def recycle_render_pool(pool):
+    """
+    Replaces pool with a fresh one (unless another thread already has) and kills its worker
+    processes. Used when the pool is broken (a worker crashed or was OOM-killed) and to free a stuck
+    render, since ProcessPoolExecutor can't stop a single job. Other renders still running on the
+    old pool fail with BrokenProcessPool (and are retried by convert_to_pdf).
+    """
+    with get_render_pool_lock():
+        if get_render_pool() is pool:
+            get_render_pool.clear()
+    for process in list((pool._processes or {}).values()): # No public API to stop a worker
+        process.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+@st.cache_resource
+def get_filing_pool():
+    """Returns the persistent thread pool that downloads/parses filings (network-bound), reused across runs."""
+    return ThreadPoolExecutor(max_workers=FILING_DOWNLOAD_WORKERS, thread_name_prefix="mzansi-filing")
+
+@st.cache_resource
+def get_asset_pool():
+    """
+    Returns the persistent thread pool for asset downloads. Separate from the filing pool because
+    filing workers block on asset futures; sharing one pool could deadlock once it fills up.
+    """
+    return ThreadPoolExecutor(max_workers=ASSET_DOWNLOAD_WORKERS, thread_name_prefix="mzansi-asset")
+
+filing_pool = get_filing_pool()
+asset_pool = get_asset_pool()
+
 
 # --- Scope Control ---
 # Fiscal Year cutoff: Process filings from this year onwards.
 EARLIEST_FISCAL_YEAR_SUFFIX = 17
+FISCAL_CUTOFF_YEAR = 2000 + EARLIEST_FISCAL_YEAR_SUFFIX
+RELEVANT_FORMS = frozenset(("10-K", "10-Q"))
 # --- Limit to Prevent Resource Exhaustion ---
 MAX_FILINGS_TO_PROCESS = 5 # Limit the number of relevant filings processed (low for testing)
 # ----------------------------------
 
+# Fiscal year-end month choices for the form ("1" -> "January", ...), from calendar's precomputed names (no strftime)
+MONTH_OPTIONS = {str(i): calendar.month_name[i] for i in range(1, 13)}
+# UI text derived from the scope constants above, kept next to them instead of inline in the layout code
+INSTRUCTIONS_MD = f"""
+    **Instructions:**
+    1.  Enter the company's Central Index Key (CIK). [Find CIK here](https://www.sec.gov/edgar/searchedgar/cik).
+    2.  (Optional) Enter the stock ticker (used for PDF filenames if provided).
+    3.  Select the company's Fiscal Year-End Month.
+    4.  Choose the Fiscal Year Basis (usually "Same Year").
+    5.  Click "Fetch Filings". *Fetches up to {MAX_FILINGS_TO_PROCESS} filings: FY{EARLIEST_FISCAL_YEAR_SUFFIX} 10-K and all newer 10-Ks/10-Qs found.*
+    6.  (Optional) Check the box to delete intermediate HTML files after conversion.
+    7.  Check the process log for details, especially if PDF quality is unexpected or errors occur.
+"""
+FOOTER_CAPTION = f"Mzansi EDGAR Fetcher v2.3 | Data sourced from SEC EDGAR | Uses WeasyPrint | Fetches up to {MAX_FILINGS_TO_PROCESS} filings from FY{EARLIEST_FISCAL_YEAR_SUFFIX} 10-K onwards."
+# Per-filing debug messages are only formatted when this is True (the log is read once at the end)
+DEBUG_LOG = False
+LOG_MAX_LINES = 10000 # Bound on the per-run log; the oldest lines are dropped beyond this
+
+# Common mojibake / entity fix-ups applied to the decoded filing text. One compiled alternation
+# (longest keys first) scans the multi-MB document once instead of once per replacement.
+_MOJIBAKE = { "Â\x9d": "\"", "â€œ": "\"", "â€™": "'", "â€˜": "'", "â€“": "-", "â€”": "—", "&nbsp;": " ", "\u00a0": " " }
+_MOJIBAKE_RE = re.compile("|".join(re.escape(k) for k in sorted(_MOJIBAKE, key=len, reverse=True)))
+# Cheap pre-scan: only parse the HTML when it references images or stylesheets to download
+_ASSET_HINT_RE = re.compile(r"<img\b|<link\b[^>]*stylesheet", re.IGNORECASE)
+
+class SanitizeTable(dict):
+    """
+    str.translate table for filename sanitizing: keeps alphanumerics (Unicode-aware, same as
+    str.isalnum) and the given extra characters, maps everything else to '_'. Entries are filled
+    in on first sight of each code point, so translate() runs as a C loop over cached lookups.
+    """
+    def __init__(self, extra_allowed):
+        super().__init__()
+        self.extra_allowed = extra_allowed
+
+    def __missing__(self, codepoint):
+        char = chr(codepoint)
+        replacement = char if char.isalnum() or char in self.extra_allowed else '_'
+        self[codepoint] = replacement
+        return replacement
+
+# File extensions for the content types EDGAR actually serves for filing assets; anything else
+# falls back to mimetypes.guess_extension
+_EXTENSION_BY_MIME = {
+    'image/png': '.png', 'image/jpeg': '.jpg', 'image/jpg': '.jpg', 'image/gif': '.gif',
+    'image/svg+xml': '.svg', 'image/bmp': '.bmp', 'image/tiff': '.tif', 'image/webp': '.webp',
+    'text/css': '.css', 'application/pdf': '.pdf',
+}
+
+ASSET_NAME_TABLE = SanitizeTable('._-') # Asset filenames keep their extension dot
+PDF_NAME_TABLE = SanitizeTable('_-')
 
 # -------------------------
 # Backend Functions
 # -------------------------
 
-# get_filing_period function remains the same
-def get_filing_period(form, filing_date, fiscal_year_end_month, fy_adjust):
+# Memoized: pure, and called for each filing both while filtering and when naming its PDF
+@lru_cache(maxsize=4096)
+def get_filing_period(form, filing_date_iso, fiscal_year_end_month, fy_adjust):
     """
-    Determines the fiscal period string (e.g., FY23, 1Q24) based on filing date and fiscal year end.
-    Handles December and non-December fiscal year ends.
+    Determines the fiscal period string (e.g., FY23, 1Q24) based on filing date ("YYYY-MM-DD")
+    and fiscal year end. Handles December and non-December fiscal year ends.
+    Raises ValueError for a malformed date.
     """
+    filing_date = datetime.strptime(filing_date_iso, "%Y-%m-%d")
     # Ensure fiscal_year_end_month is a valid integer (1-12)
     try:
         fiscal_year_end_month = int(fiscal_year_end_month)
@@ -134,21 +359,111 @@ def get_filing_period(form, filing_date, fiscal_year_end_month, fy_adjust):
                 fiscal_year -= 1
             return f"FY{fiscal_year % 100:02d}"
 
+# --- Run-scoped asset cache (shared by all filings in one run) ---
+class AssetCache:
+    """
+    Requests each asset URL at most once per run. Bodies live in the persistent HTTP cache and are
+    hard-linked (or copied, where links aren't supported) into every filing directory that
+    references them, so an issuer's logo/stylesheet isn't re-fetched for each of its filings, and
+    across runs is only revalidated (304) rather than downloaded again.
+    Thread-safe: concurrent requests for the same URL wait for the first download to finish.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {} # absolute_url -> {"ready": Event, "path": cached path, "filename": str, "error": Exception}
+
+    def get(self, absolute_url, safe_filename):
+        """
+        Returns (cached_path, filename) for absolute_url, downloading it on the first request.
+        filename may gain an extension guessed from the content type. Re-raises the download error.
+        """
+        with self.lock:
+            entry = self.entries.get(absolute_url)
+            is_owner = entry is None
+            if is_owner:
+                entry = {"ready": threading.Event(), "path": None, "filename": None, "error": None}
+                self.entries[absolute_url] = entry
+
+        if is_owner:
+            try: entry["path"], entry["filename"] = download_asset(absolute_url, safe_filename)
+            except Exception as e:
+                entry["error"] = e
+                raise
+            finally: entry["ready"].set()
+        else:
+            entry["ready"].wait()
+            if entry["error"] is not None: raise entry["error"]
+        return entry["path"], entry["filename"]
+
+@lru_cache(maxsize=64)
+def guess_asset_extension(mime_type):
+    """Extension for a lowercased, parameter-free content type (memoized: mimetypes rescans per call)."""
+    return _EXTENSION_BY_MIME.get(mime_type) or mimetypes.guess_extension(mime_type)
+
+def download_asset(absolute_url, safe_filename):
+    """
+    Fetches one asset through the persistent HTTP cache (streamed to disk, revalidated with a
+    conditional GET when already cached by an earlier run). Returns (cached_path, filename), where
+    filename is safe_filename with an extension guessed from the content type when it lacks one.
+    """
+    cached_path, content_type = fetch_file_with_http_cache(absolute_url)
+    guessed_ext = None
+    if content_type:
+        mime_type = content_type.split(';', 1)[0].strip().lower()
+        guessed_ext = guess_asset_extension(mime_type)
+    if guessed_ext and guessed_ext != ".asset" and not safe_filename.lower().endswith(guessed_ext.lower()):
+         base, _ = os.path.splitext(safe_filename)
+         safe_filename = base + guessed_ext
+    return cached_path, safe_filename
+
+# --- Single asset placement (runs on an asset worker thread) ---
+def fetch_asset(absolute_url, safe_filename, filing_output_dir, asset_cache):
+    """
+    Places one asset into filing_output_dir (via the run's AssetCache) and returns the filename
+    actually used, which may gain an extension guessed from the response content type.
+    Exceptions propagate to download_assets, which logs them.
+    """
+    cached_path, cached_filename = asset_cache.get(absolute_url, safe_filename)
+
+    # Prefer the name with the guessed extension, falling back to the planned name if another asset
+    # already took it. Creating the file is the existence check (no stat beforehand), and it can't
+    # race with another worker placing a file under the same name.
+    for filename in dict.fromkeys((cached_filename, safe_filename)):
+        local_path = os.path.join(filing_output_dir, filename)
+        try:
+            os.link(cached_path, local_path) # Same temp filesystem: no data copied
+        except FileExistsError:
+            continue
+        except OSError: # Links unsupported (or cross-device)
+            try:
+                with open(cached_path, 'rb') as src, open(local_path, 'xb') as dst: shutil.copyfileobj(src, dst)
+            except FileExistsError:
+                continue
+        return filename
+    return safe_filename # Already present under the planned name
+
 # --- MODIFIED download_assets function ---
-def download_assets(soup, base_url, filing_output_dir, log_lines): # Accepts specific dir
+def download_assets(doc, base_url, filing_output_dir, asset_cache, log_lines): # Accepts specific dir
     """
     Downloads assets (images, CSS) linked in the HTML, saves them into the
     specific filing's output directory, and updates links to relative paths.
+    Downloads run concurrently on a small thread pool; the lxml tree is only read
+    and modified on the calling thread (lxml trees are not safe to mutate concurrently).
+    Returns (downloaded filenames, number of assets that could not be downloaded).
     """
     downloaded_assets_filenames = set()
-    processed_urls = set()
+    planned_downloads = {} # absolute_url -> safe filename it will be saved as
+    url_for_filename = {} # safe filename -> absolute_url that downloads it
+    url_owner = {} # absolute_url -> absolute_url whose download it shares
+    tags_by_url = defaultdict(list) # downloading absolute_url -> [(tag, url_attr)] to rewrite
     tags_and_attrs = [('img', 'src'), ('link', 'href')]
 
+    # --- Phase 1: resolve URLs and plan filenames (no network) ---
     for tag_name, url_attr in tags_and_attrs:
-        for tag in soup.find_all(tag_name):
+        for tag in doc.iter(tag_name):
             if tag_name == 'link':
                 rel = tag.get('rel')
-                if not rel or 'stylesheet' not in rel: continue
+                if not rel or 'stylesheet' not in rel.lower().split(): continue
             asset_url = tag.get(url_attr)
             if not asset_url or asset_url.startswith(('data:', 'javascript:')): continue
 
@@ -160,258 +475,493 @@ def download_assets(soup, base_url, filing_output_dir, log_lines): # Accepts spe
                 continue
 
             if parsed_url.scheme not in ['http', 'https']: continue
-            if absolute_url in processed_urls: continue
-            processed_urls.add(absolute_url)
-
-            try:
+            if absolute_url not in url_owner:
                 path_part = parsed_url.path
                 filename_base = os.path.basename(path_part)
                 if not filename_base:
                     segments = [s for s in path_part.split('/') if s]
-                    filename_base = segments[-1] if segments else f"asset_{len(downloaded_assets_filenames) + 1}"
+                    filename_base = segments[-1] if segments else f"asset_{len(planned_downloads) + 1}"
 
-                safe_filename = "".join(c if c.isalnum() or c in ['.', '_', '-'] else '_' for c in filename_base)
+                safe_filename = filename_base.translate(ASSET_NAME_TABLE)
                 safe_filename = safe_filename[:100].strip('._')
-                if not safe_filename: safe_filename = f"asset_{len(downloaded_assets_filenames) + 1}"
+                if not safe_filename: safe_filename = f"asset_{len(planned_downloads) + 1}"
 
                 _, ext = os.path.splitext(safe_filename)
                 if not ext: safe_filename += ".asset"
-                # --- Save asset in the specific filing's directory ---
-                local_path = os.path.join(filing_output_dir, safe_filename)
-
-                if not os.path.exists(local_path):
-                    time.sleep(0.11)
-                    r = session.get(absolute_url, timeout=DEFAULT_TIMEOUT)
-                    r.raise_for_status()
-
-                    content_type = r.headers.get('content-type')
-                    guessed_ext = None
-                    if content_type:
-                        guessed_ext = mimetypes.guess_extension(content_type.split(';')[0])
-                    if guessed_ext and guessed_ext != ".asset" and not safe_filename.lower().endswith(guessed_ext.lower()):
-                         base, _ = os.path.splitext(safe_filename)
-                         new_safe_filename = base + guessed_ext
-                         new_local_path = os.path.join(filing_output_dir, new_safe_filename)
-                         if not os.path.exists(new_local_path):
-                              safe_filename = new_safe_filename
-                              local_path = new_local_path
-
-                    with open(local_path, 'wb') as f: f.write(r.content)
-
-                # --- Update link to be relative filename ---
-                tag[url_attr] = safe_filename
-                downloaded_assets_filenames.add(safe_filename)
-
-            except requests.exceptions.Timeout:
-                 log_lines.append(f"Warning: Asset download timeout for {absolute_url}")
-            except requests.exceptions.RequestException as e:
-                log_lines.append(f"Warning: Asset download error for {absolute_url}: {str(e)}")
-            except IOError as e:
-                log_lines.append(f"Warning: Asset file write error for {safe_filename}: {str(e)}")
-            except Exception as e:
-                log_lines.append(f"Warning: General error processing asset {absolute_url}: {str(e)}")
 
-    # if downloaded_assets_filenames: # Reduce log noise
-    #     log_lines.append(f"Processed {len(downloaded_assets_filenames)} asset file(s).")
-    return list(downloaded_assets_filenames)
+                # If another URL already claimed this filename, share its file (first one wins)
+                owner_url = url_for_filename.setdefault(safe_filename, absolute_url)
+                if owner_url == absolute_url:
+                    planned_downloads[absolute_url] = safe_filename
+                url_owner[absolute_url] = owner_url
+            tags_by_url[url_owner[absolute_url]].append((tag, url_attr))
+
+    if not planned_downloads:
+        return [], 0
+
+    # --- Phase 2: download concurrently into the specific filing's directory ---
+    # Persistent pool (see get_asset_pool), so no per-filing thread startup/shutdown
+    futures = {asset_pool.submit(fetch_asset, absolute_url, safe_filename, filing_output_dir, asset_cache): absolute_url
+               for absolute_url, safe_filename in planned_downloads.items()}
+
+    failed_count = 0
+    for future in as_completed(futures):
+        absolute_url = futures[future]
+        try:
+            safe_filename = future.result()
+        except requests.exceptions.Timeout:
+             log_lines.append(f"Warning: Asset download timeout for {absolute_url}")
+             failed_count += 1
+             continue
+        except requests.exceptions.RequestException as e:
+            log_lines.append(f"Warning: Asset download error for {absolute_url}: {str(e)}")
+            failed_count += 1
+            continue
+        except IOError as e:
+            log_lines.append(f"Warning: Asset file write error for {planned_downloads[absolute_url]}: {str(e)}")
+            failed_count += 1
+            continue
+        except Exception as e:
+            log_lines.append(f"Warning: General error processing asset {absolute_url}: {str(e)}")
+            failed_count += 1
+            continue
+
+        # --- Phase 3: update links to be relative filenames (calling thread only) ---
+        for tag, url_attr in tags_by_url[absolute_url]:
+            tag.set(url_attr, safe_filename)
+        downloaded_assets_filenames.add(safe_filename)
+
+    if DEBUG_LOG and downloaded_assets_filenames: # Reduce log noise
+        log_lines.append(f"Processed {len(downloaded_assets_filenames)} asset file(s).")
+    return list(downloaded_assets_filenames), failed_count
+
+# --- Chromium fallback renderer (only used after a WeasyPrint timeout) ---
+def render_pdf_chromium(html_bytes, filing_output_dir, pdf_path=None):
+    """
+    Renders the processed HTML with headless Chromium (Playwright) and returns the PDF bytes.
+    The HTML is written into filing_output_dir first so relative asset links resolve.
+    Page settings mirror app.py's Chrome renderer. Exceptions propagate to convert_to_pdf.
+    """
+    render_html_path = os.path.join(filing_output_dir, "_chromium_render.htm")
+    with open(render_html_path, 'wb') as f:
+        # A BOM makes Chromium read the file as UTF-8 even when the HTML has no charset <meta>
+        f.write(codecs.BOM_UTF8)
+        f.write(html_bytes)
+    with sync_playwright() as p:
+        browser = p.chromium.launch(headless=True)
+        try:
+            page = browser.new_page()
+            page.goto('file://' + os.path.abspath(render_html_path), wait_until='load', timeout=PDF_RENDER_TIMEOUT * 1000)
+            page.emulate_media(media='print')
+            return page.pdf(path=pdf_path, format='Letter', print_background=True, scale=0.8,
+                            margin={'top': '1cm', 'bottom': '1.5cm', 'left': '1cm', 'right': '1cm'})
+        finally:
+            browser.close()
+
+# --- Render pool dispatch ---
+def run_render(pool, html_bytes, html_dir_url, pdf_path):
+    """
+    Runs pdf_render.render_pdf on pool and returns the PDF bytes. A render slot is taken first, so
+    the job starts as soon as it is submitted and the worker-side timeout only ever counts rendering
+    time, never time spent queued behind other filings. If the worker overruns even the backstop
+    wait, the pool is recycled to kill it. RenderTimeout, FuturesTimeoutError and BrokenProcessPool
+    propagate to convert_to_pdf.
+    """
+    render_slots = get_render_slots()
+    render_slots.acquire()
+    try:
+        render_future = pool.submit(pdf_render.render_pdf, html_bytes, html_dir_url, pdf_path, PDF_RENDER_TIMEOUT)
+    except BaseException:
+        render_slots.release()
+        raise
+    render_future.add_done_callback(lambda _: render_slots.release())
+    try:
+        # The worker abandons the render itself after PDF_RENDER_TIMEOUT; this wait is a backstop
+        return render_future.result(timeout=PDF_RENDER_TIMEOUT + PDF_RENDER_TIMEOUT_GRACE)
+    except FuturesTimeoutError:
+        # Worker stuck past its own alarm (e.g. inside native code): replace the pool to kill it
+        recycle_render_pool(pool)
+        raise
 
 # --- MODIFIED convert_to_pdf function ---
-def convert_to_pdf(html_path, form, date, accession, cik, ticker, fy_month_idx, fy_adjust, log_lines):
+def get_pdf_filename(form, date, accession, cik, ticker, fy_month_idx, fy_adjust):
+    """Download filename for a filing's PDF, e.g. "AAPL_1Q24.pdf" (ticker, else CIK, plus fiscal period)."""
+    period = get_filing_period(form, date, fy_month_idx, fy_adjust)
+    base_name = f"{ticker}_{period}" if ticker else f"{cik}_{period}"
+    safe_base_name = base_name.translate(PDF_NAME_TABLE).strip('._')
+    if not safe_base_name: safe_base_name = f"{cik}_{accession}"
+    return f"{safe_base_name}.pdf"
+
+def convert_to_pdf(html_bytes, filing_output_dir, form, date, accession, cik, ticker, fy_month_idx, fy_adjust, keep_pdf_file, log_lines):
     """
-    Converts the local HTML file to PDF using WeasyPrint.
+    Converts the processed HTML (UTF-8 bytes, already in memory) to a PDF
+    using WeasyPrint. Relative asset links resolve against filing_output_dir.
     Applies custom CSS to control page margins, set EB Garamond font, and add page numbers.
+    Returns (pdf_filename, pdf_bytes, used_chromium), or None on failure; used_chromium is True when
+    WeasyPrint timed out and the Chromium fallback produced the PDF. The PDF is only written into
+    filing_output_dir as well when keep_pdf_file is True (intermediate files are being kept).
     """
     pdf_path = None
+    used_chromium = False
     try:
-        filing_date = datetime.strptime(date, "%Y-%m-%d")
-        period = get_filing_period(form, filing_date, fy_month_idx, fy_adjust)
-        base_name = f"{ticker}_{period}" if ticker else f"{cik}_{period}"
-        safe_base_name = "".join(c if c.isalnum() or c in ['_', '-'] else '_' for c in base_name).strip('._')
-        if not safe_base_name: safe_base_name = f"{cik}_{accession}"
-        pdf_filename = f"{safe_base_name}.pdf"
-        pdf_path = os.path.join(os.path.dirname(html_path), pdf_filename)
-        # log_lines.append(f"Attempting PDF conversion with WeasyPrint: {pdf_filename}")
-
-        html_dir_url = 'file://' + os.path.dirname(os.path.abspath(html_path)) + '/'
-        html = HTML(filename=html_path, base_url=html_dir_url)
-
-        # --- Define CSS for PDF page margins, EB Garamond font, and page numbers ---
-        # IMPORTANT: Assumes 'EBGaramond-Regular.ttf' (or similar) is in a 'fonts' subdirectory.
-        #            Verify the filename and adjust the url() path if needed.
-        styling_css_string = """
-        /* Embed the EB Garamond font */
-        @font-face {
-            font-family: "EB Garamond";
-            /* Verify this filename matches the font file you added */
-            src: url('fonts/EBGaramond-Regular.ttf') format('truetype');
-            font-weight: normal;
-            font-style: normal;
-        }
-        /* You might need additional @font-face rules for Bold, Italic, etc. if used */
-        /* e.g., src: url('fonts/EBGaramond-Bold.ttf'); font-weight: bold; */
-
-        /* Define page layout */
-        @page {
-            margin-top: 0.8cm; /* Keep reduced top margin */
-            margin-bottom: 1.5cm; /* Keep margin for footer */
-            margin-left: 1cm;
-            margin-right: 1cm;
-
-            /* Add page number in the bottom center using EB Garamond */
-            @bottom-center {
-                content: "Page " counter(page) " of " counter(pages);
-                font-family: "EB Garamond", serif; /* Use EB Garamond */
-                font-size: 9pt;
-                color: #555;
-                vertical-align: top;
-                padding-top: 5mm;
-            }
-        }
-
-        /* Set base body font to EB Garamond */
-        body {
-            font-family: "EB Garamond", serif; /* Use EB Garamond, fallback to generic serif */
-            font-size: 11pt;   /* Adjust base font size as needed */
-            line-height: 1.3;
-        }
-
-        /* Optional: Basic table styling */
-        table {
-            border-collapse: collapse;
-            width: 100%;
-            margin-top: 0.5em;
-            margin-bottom: 0.5em;
-         }
-        th, td {
-            border: 1px solid #ccc;
-            padding: 4px 6px;
-            text-align: left;
-            vertical-align: top;
-        }
-        th {
-             background-color: #f2f2f2;
-             font-weight: bold;
-        }
-        """
-        styling_css = CSS(string=styling_css_string)
-        # ----------------------------------------------------
+        pdf_filename = get_pdf_filename(form, date, accession, cik, ticker, fy_month_idx, fy_adjust)
+        if keep_pdf_file: pdf_path = os.path.join(filing_output_dir, pdf_filename)
+        if DEBUG_LOG: log_lines.append(f"Attempting PDF conversion with WeasyPrint: {pdf_filename}")
 
-        # Render the PDF, applying the custom CSS
-        html.write_pdf(pdf_path, stylesheets=[styling_css])
+        html_dir_url = 'file://' + os.path.abspath(filing_output_dir) + '/'
 
-        if os.path.exists(pdf_path) and os.path.getsize(pdf_path) > 100:
+        # Render the PDF (custom CSS applied) in a worker process; this download thread just waits,
+        # so other filings keep downloading while this one renders on another core.
+        for attempt in range(2):
+            pool = get_render_pool()
+            try:
+                pdf_bytes = run_render(pool, html_bytes, html_dir_url, pdf_path)
+                break
+            except BrokenProcessPool:
+                # A worker died (crash, OOM kill, or another filing's recycle): retry once on a fresh pool
+                if attempt: raise
+                log_lines.append(f"Warning: PDF render pool broke while rendering {pdf_filename}; retrying on a new pool.")
+                recycle_render_pool(pool)
+            except (pdf_render.RenderTimeout, FuturesTimeoutError):
+                if sync_playwright is None:
+                    log_lines.append(f"ERROR: WeasyPrint took longer than {PDF_RENDER_TIMEOUT}s for {pdf_filename} and no Chromium fallback is installed.")
+                    return None
+                log_lines.append(f"Warning: WeasyPrint took longer than {PDF_RENDER_TIMEOUT}s for {pdf_filename}; retrying with headless Chromium.")
+                pdf_bytes = render_pdf_chromium(html_bytes, filing_output_dir, pdf_path)
+                used_chromium = True
+                break
+
+        if pdf_bytes and len(pdf_bytes) > 100:
             log_lines.append(f"PDF created: {pdf_filename}")
-            return pdf_path
+            return (pdf_filename, pdf_bytes, used_chromium)
         else:
             log_lines.append(f"ERROR: WeasyPrint conversion resulted in missing or near-empty file: {pdf_filename}")
-            if os.path.exists(pdf_path):
-                 try: os.remove(pdf_path)
-                 except OSError: pass
+            if pdf_path:
+                try: os.unlink(pdf_path)
+                except OSError: pass # Includes FileNotFoundError when nothing was written
             return None
 
-    except FileNotFoundError:
-        log_lines.append(f"ERROR: HTML file not found for PDF conversion: {html_path}")
-        return None
     except ValueError as e:
-         log_lines.append(f"ERROR: Value error during PDF setup ({os.path.basename(html_path)}): {str(e)}")
+         log_lines.append(f"ERROR: Value error during PDF setup ({accession}): {str(e)}")
          return None
     except Exception as e:
-        log_lines.append(f"ERROR: WeasyPrint PDF conversion failed for {accession} ({os.path.basename(html_path)}): {str(e)}")
+        log_lines.append(f"ERROR: WeasyPrint PDF conversion failed for {accession}: {str(e)}")
         # Check if it's a font loading error
         if "font" in str(e).lower() or "EBGaramond" in str(e):
              log_lines.append("Hint: Check if the font file ('fonts/EBGaramond-Regular.ttf') exists and the path/filename in the CSS is correct.")
         log_lines.append(traceback.format_exc(limit=1))
-        if pdf_path and os.path.exists(pdf_path):
-            try: os.remove(pdf_path)
+        if pdf_path:
+            try: os.unlink(pdf_path)
+            except FileNotFoundError: pass # Nothing was written
             except OSError as e_clean: log_lines.append(f"Warning: Could not remove failed PDF {pdf_filename} during cleanup: {e_clean}")
         return None
 
-# --- MODIFIED cleanup_files function ---
-def cleanup_files(html_path, assets, filing_output_dir, log_lines): # Accepts specific dir
-    """Removes the temporary HTML file and downloaded asset files from the specific filing directory."""
-    cleaned_count = 0
+# --- Primary document body reader ---
+def read_response_body(r):
+    """
+    Reads a streamed response body. When the size is known up front (Content-Length with no
+    Content-Encoding, so the wire bytes are the body), reads straight into one preallocated
+    bytearray instead of letting r.content grow a buffer chunk by chunk. Otherwise uses r.content.
+    """
+    content_length = r.headers.get('Content-Length')
+    if not content_length or not content_length.isdigit() or r.headers.get('Content-Encoding', 'identity') != 'identity':
+        return r.content
+    buf = bytearray(int(content_length))
+    view = memoryview(buf)
+    filled = 0
+    while filled < len(buf):
+        n = r.raw.readinto(view[filled:])
+        if not n: break # Server sent less than advertised
+        filled += n
+    view.release()
+    if filled < len(buf): del buf[filled:]
+    return buf
+
+# --- Cache directory pruning ---
+def prune_cache_dir(cache_dir, max_age, max_bytes):
+    """
+    Bounds an on-disk cache directory: removes files not modified for max_age seconds, then the
+    oldest remaining files until at most max_bytes are left. Readers with an open file are
+    unaffected, and a missing entry is simply fetched again. In-progress .tmp files are only
+    removed once they are stale. Errors are ignored.
+    """
+    cutoff = time.time() - max_age
+    entries = []
     try:
-        # Clean HTML file
-        if html_path and os.path.exists(html_path):
-            os.remove(html_path)
-            cleaned_count += 1
-
-        # Clean asset files from the specific directory
-        for asset_filename in assets:
-            asset_path = os.path.join(filing_output_dir, asset_filename) # Use filing_output_dir
-            if os.path.exists(asset_path):
+        with os.scandir(cache_dir) as it:
+            for entry in it:
                 try:
-                    os.remove(asset_path)
-                    cleaned_count += 1
-                except OSError as e:
-                     log_lines.append(f"Warning: Error cleaning asset {asset_filename}: {e}")
+                    if not entry.is_file(follow_symlinks=False): continue
+                    info = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                if entry.name.endswith('.tmp') and info.st_mtime >= cutoff: continue # Being written right now
+                entries.append((info.st_mtime, info.st_size, entry.path))
+    except OSError:
+        return # Cache directory not created yet
+    entries.sort() # Oldest first
+    total_bytes = sum(size for _, size, _ in entries)
+    for mtime, size, path in entries:
+        if mtime >= cutoff and total_bytes <= max_bytes: break
+        try: os.remove(path)
+        except OSError: continue
+        total_bytes -= size
+
+@st.cache_data(ttl=CACHE_PRUNE_INTERVAL, show_spinner=False)
+def prune_caches():
+    """Prunes the on-disk caches. Cached by Streamlit, so it runs at most once per CACHE_PRUNE_INTERVAL."""
+    prune_cache_dir(HTTP_CACHE_DIR, HTTP_CACHE_MAX_AGE, HTTP_CACHE_MAX_BYTES)
+    prune_cache_dir(PDF_CACHE_DIR, PDF_CACHE_MAX_AGE, PDF_CACHE_MAX_BYTES)
+
+# --- On-disk HTTP cache with conditional revalidation ---
+def http_cache_entry(url):
+    """
+    Returns (body_path, meta_path, meta, conditional_headers) for url's entry in HTTP_CACHE_DIR
+    (keyed by sha1(url)). meta holds the stored validators/content type ({} when there is no
+    readable entry yet); conditional_headers carries If-None-Match / If-Modified-Since from them.
+    """
+    cache_key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+    body_path = os.path.join(HTTP_CACHE_DIR, cache_key)
+    meta_path = body_path + ".json"
 
-        if cleaned_count > 0:
-            log_lines.append(f"Cleaned {cleaned_count} intermediate file(s) for this filing.")
-    except Exception as e:
-        log_lines.append(f"ERROR: Exception during file cleanup for {os.path.basename(filing_output_dir)}: {str(e)}")
+    meta = {}
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f: meta = json.load(f)
+    except (OSError, ValueError):
+        pass # No (readable) cache entry yet
+    conditional_headers = {}
+    if meta.get('etag'): conditional_headers['If-None-Match'] = meta['etag']
+    if meta.get('last_modified'): conditional_headers['If-Modified-Since'] = meta['last_modified']
+    return body_path, meta_path, meta, conditional_headers
+
+def write_http_cache_meta(meta_path, meta):
+    """Atomically writes an entry's metadata (write then os.replace, like the body)."""
+    tmp_path = f"{meta_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f: json.dump(meta, f)
+    os.replace(tmp_path, meta_path)
+
+def touch_http_cache_entry(body_path, meta_path):
+    """Marks an entry as recently used (prune_cache_dir goes by mtime). Raises OSError if the body is gone."""
+    os.utime(body_path)
+    try: os.utime(meta_path)
+    except OSError: pass
+
+def fetch_with_http_cache(url):
+    """
+    GETs url (rate-limited) and returns the body bytes, keeping a copy in HTTP_CACHE_DIR keyed by
+    sha1(url). When a cached copy exists, the request carries If-None-Match / If-Modified-Since
+    from the stored validators and a 304 answer is served from disk. Only responses with an ETag or
+    Last-Modified are cached. Cache write failures are ignored (the body is still returned).
+    Request errors propagate to the caller.
+    """
+    body_path, meta_path, _, conditional_headers = http_cache_entry(url)
+
+    with rate_limited_get(url, timeout=DEFAULT_TIMEOUT, stream=True, headers=conditional_headers) as r:
+        if r.status_code == 304 and conditional_headers:
+            try:
+                touch_http_cache_entry(body_path, meta_path) # Still in use, so keep it through pruning
+                with open(body_path, 'rb') as f: return f.read()
+            except OSError:
+                # Body evicted under us: fetch it again unconditionally
+                with rate_limited_get(url, timeout=DEFAULT_TIMEOUT, stream=True) as r_full:
+                    r_full.raise_for_status()
+                    return read_response_body(r_full)
+        r.raise_for_status()
+        body = read_response_body(r)
+        etag, last_modified = r.headers.get('ETag'), r.headers.get('Last-Modified')
+
+    if etag or last_modified:
+        try:
+            os.makedirs(HTTP_CACHE_DIR, exist_ok=True)
+            # Write then os.replace, so concurrent readers never see a half-written entry
+            tmp_path = f"{body_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f: f.write(body)
+            os.replace(tmp_path, body_path)
+            write_http_cache_meta(meta_path, {'url': url, 'etag': etag, 'last_modified': last_modified})
+        except OSError:
+            pass
+    return body
+
+def fetch_file_with_http_cache(url):
+    """
+    Like fetch_with_http_cache, but streams the body straight into its HTTP_CACHE_DIR entry instead
+    of returning it, for assets that are only ever linked/copied as files. Returns
+    (body_path, content_type). Every body is stored (so it can be linked into filing directories);
+    validators are recorded when the server sends them, so a later run revalidates with a 304
+    instead of downloading again. Request and write errors propagate to the caller.
+    """
+    body_path, meta_path, meta, conditional_headers = http_cache_entry(url)
 
+    r = rate_limited_get(url, timeout=DEFAULT_TIMEOUT, stream=True, headers=conditional_headers)
+    if r.status_code == 304:
+        r.close()
+        if conditional_headers:
+            try:
+                touch_http_cache_entry(body_path, meta_path) # Still in use, so keep it through pruning
+                return body_path, meta.get('content_type')
+            except OSError:
+                pass
+        # Body evicted under us: fetch it again unconditionally
+        r = rate_limited_get(url, timeout=DEFAULT_TIMEOUT, stream=True)
+    with r:
+        r.raise_for_status()
+        content_type = r.headers.get('content-type')
+        etag, last_modified = r.headers.get('ETag'), r.headers.get('Last-Modified')
+        os.makedirs(HTTP_CACHE_DIR, exist_ok=True)
+        tmp_path = f"{body_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        r.raw.decode_content = True # Undo gzip/deflate transfer encoding while copying
+        try:
+            with open(tmp_path, 'wb') as f: shutil.copyfileobj(r.raw, f, DOWNLOAD_CHUNK_SIZE)
+        except BaseException:
+            try: os.remove(tmp_path) # Don't leave a partial body behind
+            except OSError: pass
+            raise
+
+    # os.replace gives the entry a new inode, so files already hard-linked from the old body are untouched
+    os.replace(tmp_path, body_path)
+    if etag or last_modified:
+        try: write_http_cache_meta(meta_path, {'url': url, 'etag': etag, 'last_modified': last_modified, 'content_type': content_type})
+        except OSError: pass
+    else:
+        try: os.remove(meta_path) # Drop stale validators so the next run doesn't send them
+        except OSError: pass
+    return body_path, content_type
+
+# --- Persistent rendered-PDF cache ---
+def pdf_cache_path(accession):
+    """
+    Returns accession's path in PDF_CACHE_DIR. The name includes PDF_CACHE_VERSION and
+    pdf_render.RENDER_FINGERPRINT, so PDFs rendered with older processing or styling are never
+    reused (they age out of the directory instead).
+    """
+    return os.path.join(PDF_CACHE_DIR, f"{accession}_v{PDF_CACHE_VERSION}_{pdf_render.RENDER_FINGERPRINT}.pdf")
+
+def read_cached_pdf(accession):
+    """
+    Returns the PDF bytes rendered for accession by an earlier run, or None. Accession numbers
+    are immutable on EDGAR, so a hit skips the download, asset fetch and render entirely.
+    """
+    try:
+        with open(pdf_cache_path(accession), 'rb') as f: return f.read()
+    except OSError:
+        return None
+
+def write_cached_pdf(accession, pdf_bytes):
+    """Stores a rendered PDF for later runs (write then os.replace). Write failures are ignored."""
+    try:
+        os.makedirs(PDF_CACHE_DIR, exist_ok=True)
+        cache_path = pdf_cache_path(accession)
+        tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f: f.write(pdf_bytes)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass
 
 # --- MODIFIED download_and_process function ---
-def download_and_process(doc_url, cik, form, date, accession, ticker, fy_month, fy_adjust, cleanup_flag, log_lines, filing_output_dir): # Accepts specific dir
+def download_and_process(doc_url, cik, form, date, accession, ticker, fy_month, fy_adjust, cleanup_flag, log_lines, filing_output_dir, asset_cache): # Accepts specific dir
     """
     Worker function: Downloads HTML/assets into filing_output_dir, converts to PDF, optionally cleans up.
-    Returns a tuple: (form_type, path_to_pdf or None).
+    Returns a tuple: (form_type, pdf_filename or None, pdf_bytes or None).
     """
     html_path = None
-    downloaded_assets = []
-    pdf_path = None
     log_prefix = f"[{accession} {form}]"
 
     try:
+        # --- Reuse a PDF rendered by an earlier run (not when intermediate files are being kept) ---
+        if cleanup_flag:
+            pdf_bytes = read_cached_pdf(accession)
+            if pdf_bytes:
+                pdf_filename = get_pdf_filename(form, date, accession, cik, ticker, fy_month, fy_adjust)
+                log_lines.append(f"{log_prefix} Reusing previously rendered PDF: {pdf_filename}")
+                return (form, pdf_filename, pdf_bytes)
+
         log_lines.append(f"{log_prefix} Starting processing in {os.path.basename(filing_output_dir)}...")
         # --- Download Primary HTML Document ---
-        time.sleep(0.11)
-        # log_lines.append(f"{log_prefix} Downloading main HTML...")
-        r = session.get(doc_url, timeout=DEFAULT_TIMEOUT)
-        r.raise_for_status()
-        # log_lines.append(f"{log_prefix} Download complete.")
+        if DEBUG_LOG: log_lines.append(f"{log_prefix} Downloading main HTML...")
+        html_raw = fetch_with_http_cache(doc_url) # Revalidated against the on-disk copy on repeat runs
+        if DEBUG_LOG: log_lines.append(f"{log_prefix} Download complete.")
 
         # --- Save HTML in the specific filing's directory ---
         base_html_filename = f"{cik}_{form}_{date}_{accession}.htm"
         html_path = os.path.join(filing_output_dir, base_html_filename) # Use filing_output_dir
 
         # --- Decode HTML Content ---
-        try: decoded_text = r.content.decode('utf-8')
+        # Most filings are valid UTF-8 (or plain ASCII), and a strict decode is a single C-speed pass.
+        # Only when it fails is charset-normalizer (ships with requests) asked to detect the codec,
+        # which is far slower but picks cp1252 for the non-UTF-8 filings that latin-1 used to garble.
+        try:
+            encoding = 'utf-8'
+            decoded_text = html_raw.decode(encoding)
         except UnicodeDecodeError:
-             try: decoded_text = r.content.decode('latin-1')
-             except UnicodeDecodeError:
-                 decoded_text = r.content.decode('utf-8', errors='replace')
-                 log_lines.append(f"{log_prefix} Warning: Used 'utf-8' with error replacement.")
+            best_match = charset_from_bytes(html_raw).best()
+            encoding = best_match.encoding if best_match else 'utf-8'
+            decoded_text = html_raw.decode(encoding, errors='replace')
+        if DEBUG_LOG: log_lines.append(f"{log_prefix} Decoded as {encoding}.")
 
         # --- Pre-process & Parse HTML ---
-        replacements = { "Â\x9d": "\"", "â€œ": "\"", "â€™": "'", "â€˜": "'", "â€“": "-", "â€”": "—", "&nbsp;": " ", "\u00a0": " " }
-        for wrong, correct in replacements.items(): decoded_text = decoded_text.replace(wrong, correct)
-        soup = BeautifulSoup(decoded_text, 'html.parser')
-
-        # Ensure UTF-8 meta tag
-        if not soup.find('meta', charset=True):
-            meta_tag = soup.new_tag('meta', charset='UTF-8')
-            head = soup.head or soup.new_tag('head')
-            if not soup.head:
-                 doc_root = soup.html or soup
-                 doc_root.insert(0, head)
-            head.insert(0, meta_tag)
-
-        # --- Download Assets into the specific filing's directory ---
-        doc_base_url = urljoin(doc_url, '.')
-        downloaded_assets = download_assets(soup, doc_base_url, filing_output_dir, log_lines) # Pass filing_output_dir
-
-        # --- Save Processed HTML ---
-        with open(html_path, 'w', encoding='utf-8') as f: f.write(str(soup))
+        assets_complete = True # Cleared when an asset is missing from the render (the PDF then isn't cached)
+        decoded_text = _MOJIBAKE_RE.sub(lambda m: _MOJIBAKE[m.group(0)], decoded_text)
+        if not _ASSET_HINT_RE.search(decoded_text):
+            # No images or stylesheets to localize: skip the parse/serialize round trip entirely.
+            # No charset <meta> is needed either: the renderers are told the bytes are UTF-8.
+            html_bytes = decoded_text.encode('utf-8')
+            if DEBUG_LOG: log_lines.append(f"{log_prefix} No assets referenced; skipping HTML parse.")
+        else:
+            # A parser per call (lxml parsers are not shareable across threads). Parse UTF-8 bytes:
+            # iXBRL filings start with an XML encoding declaration, which lxml rejects on str input.
+            parser = lxml.html.HTMLParser(collect_ids=False, huge_tree=True, remove_comments=True,
+                                          remove_pis=True, encoding='utf-8')
+            try:
+                doc = lxml.html.document_fromstring(decoded_text.encode('utf-8'), parser=parser)
+            except (etree.ParserError, ValueError) as e:
+                doc = None
+                # e.g. an empty document: hand WeasyPrint the text as-is
+                log_lines.append(f"{log_prefix} Warning: HTML parse failed ({e}); rendering without asset localization.")
+
+            if doc is None:
+                html_bytes = decoded_text.encode('utf-8')
+                assets_complete = False
+            else:
+                # Drop <script>/<noscript> blocks: WeasyPrint never runs them, but still parses and lays out their text nodes
+                # (drop_tree keeps the tail text that follows each element)
+                for script_tag in list(doc.iter('script', 'noscript')):
+                    script_tag.drop_tree()
+
+                # Ensure a single UTF-8 charset declaration (the tree is re-serialized as UTF-8 below)
+                for meta_tag in doc.xpath('//meta[@charset or translate(@http-equiv, "CONTENT-TYPE", "content-type") = "content-type"]'):
+                    meta_tag.drop_tree()
+                head = doc.find('head')
+                if head is None:
+                    head = etree.Element('head')
+                    doc.insert(0, head)
+                head.insert(0, etree.Element('meta', charset='UTF-8'))
+
+                # --- Download Assets into the specific filing's directory ---
+                doc_base_url = urljoin(doc_url, '.')
+                _, failed_asset_count = download_assets(doc, doc_base_url, filing_output_dir, asset_cache, log_lines) # Pass filing_output_dir
+                assets_complete = failed_asset_count == 0
+
+                # --- Serialize Processed HTML ---
+                # Serialized straight to UTF-8 bytes by libxml2; the tree (not just the root) keeps the DOCTYPE
+                html_bytes = lxml.html.tostring(doc.getroottree(), encoding='utf-8', method='html')
+                del doc # Free the parse tree before rendering
+
+        if not cleanup_flag:
+            # Only keep an on-disk copy when files are being kept (debugging); WeasyPrint reads from memory
+            with open(html_path, 'wb') as f: f.write(html_bytes)
 
         # --- Convert to PDF ---
         log_lines.append(f"{log_prefix} Starting PDF conversion...")
-        pdf_path = convert_to_pdf(html_path, form, date, accession, cik, ticker, fy_month, fy_adjust, log_lines)
+        pdf_result = convert_to_pdf(html_bytes, filing_output_dir, form, date, accession, cik, ticker, fy_month, fy_adjust, not cleanup_flag, log_lines)
         # PDF creation/failure logged within convert_to_pdf
 
-        # --- Return PDF Path (or None) ---
-        return (form, pdf_path)
+        # --- Return PDF bytes (or None) ---
+        if pdf_result:
+            pdf_filename, pdf_bytes, used_chromium = pdf_result
+            # Only a complete WeasyPrint render is reused; anything else gets another try next run
+            if assets_complete and not used_chromium:
+                write_cached_pdf(accession, pdf_bytes)
+            return (form, pdf_filename, pdf_bytes)
 
     # --- Error Handling ---
     except requests.exceptions.Timeout:
@@ -426,12 +976,25 @@ def download_and_process(doc_url, cik, form, date, accession, ticker, fy_month,
 
     # --- Cleanup ---
     finally:
-        # Cleanup happens within the specific filing's directory
+        # The PDF lives in memory, so nothing in the filing dir is needed any more
         if cleanup_flag:
-            cleanup_files(html_path, downloaded_assets, filing_output_dir, log_lines) # Pass filing_output_dir
-        # log_lines.append(f"{log_prefix} Processing finished.") # Reduce log noise
+            shutil.rmtree(filing_output_dir, ignore_errors=True)
+        if DEBUG_LOG: log_lines.append(f"{log_prefix} Processing finished.") # Reduce log noise
+
+    return (form, None, None) # Return None if error occurred
 
-    return (form, None) # Return None if error occurred
+
+# --- Cached submissions index fetch ---
+@st.cache_data(ttl=3600, show_spinner=False)
+def fetch_submissions(cik_padded):
+    """
+    Fetches and parses the EDGAR submissions JSON for a zero-padded CIK.
+    Cached per CIK for an hour so repeat lookups skip the (often multi-MB) download and parse;
+    after that (or after a restart) the on-disk HTTP cache turns an unchanged index into a 304.
+    Errors propagate to the caller and are not cached.
+    """
+    submissions_url = f"https://data.sec.gov/submissions/CIK{cik_padded}.json"
+    return json_loads(fetch_with_http_cache(submissions_url))
 
 
 # --- MODIFIED process_filing function (with fix for UnboundLocalError) ---
@@ -439,22 +1002,23 @@ def process_filing(cik, ticker, fy_month, fy_adjust, cleanup_flag, log_lines, tm
     """
     Main orchestrator: Fetches EDGAR index, filters filings, creates subdirs,
     submits tasks to thread pool, collects results.
+    Returns (pdf_files, pdf_count, task_count): PDFs grouped by form type, how many were produced,
+    and how many filings were submitted for conversion (pdf_count < task_count means some failed).
     """
     pdf_files = {"10-K": [], "10-Q": []}
+    processed_success_count = 0 # Counted as results arrive, so callers needn't walk pdf_files
+    total_tasks = 0 # Filings submitted for conversion
     if not cik.isdigit():
         log_lines.append(f"ERROR: Invalid CIK '{cik}'. Must be numeric.")
         st.error(f"Invalid CIK provided: '{cik}'. Must be numeric.")
-        return pdf_files
+        return pdf_files, 0, 0
     cik_padded = cik.zfill(10)
+    prune_caches() # Keep HTTP_CACHE_DIR and PDF_CACHE_DIR bounded (at most once per CACHE_PRUNE_INTERVAL)
 
-    submissions_url = f"https://data.sec.gov/submissions/CIK{cik_padded}.json"
     archive_base_url = f"https://www.sec.gov/Archives/edgar/data/{cik_padded}/"
     log_lines.append(f"Accessing EDGAR index for CIK: {cik_padded}...")
     try:
-        time.sleep(0.11)
-        r = session.get(submissions_url, timeout=DEFAULT_TIMEOUT)
-        r.raise_for_status()
-        submissions = r.json()
+        submissions = fetch_submissions(cik_padded)
         log_lines.append("Successfully retrieved submission data.")
         if not ticker and 'tickers' in submissions and submissions['tickers']:
              ticker = submissions['tickers'][0]
@@ -462,14 +1026,14 @@ def process_filing(cik, ticker, fy_month, fy_adjust, cleanup_flag, log_lines, tm
     except Exception as e: # Catch all exceptions during fetch
          log_lines.append(f"ERROR: Failed to retrieve or process submission data for CIK {cik_padded}: {str(e)}")
          st.error(f"Failed to retrieve or process data for CIK {cik_padded}. Check CIK and network.")
-         return pdf_files
+         return pdf_files, 0, 0
 
     try:
         filings_data = submissions.get('filings', {}).get('recent', {})
         if not filings_data or 'accessionNumber' not in filings_data:
             log_lines.append("No recent filings found in submission data.")
             st.warning("No recent filings found for this CIK.")
-            return pdf_files
+            return pdf_files, 0, 0
 
         accession_numbers = filings_data.get('accessionNumber', [])
         forms = filings_data.get('form', [])
@@ -479,18 +1043,24 @@ def process_filing(cik, ticker, fy_month, fy_adjust, cleanup_flag, log_lines, tm
         if not (list_len == len(forms) == len(filing_dates) == len(primary_documents)):
              log_lines.append("ERROR: Filing data lists have inconsistent lengths.")
              st.error("Inconsistent data received from SEC EDGAR.")
-             return pdf_files
+             return pdf_files, 0, 0
 
         log_lines.append(f"Found {list_len} recent filings entries. Filtering...")
 
         tasks_to_submit = []
         processed_relevant_count = 0
+        # One asset cache per run: filings of the same issuer share logos/stylesheets
+        asset_cache = AssetCache()
 
         # --- Filter Filings BEFORE Submitting to Threads ---
-        for i in range(list_len):
-            form = forms[i]
-            accession_raw = accession_numbers[i]
-            if form not in ["10-K", "10-Q"]: continue
+        # One tuple unpack per row instead of indexing four parallel lists
+        for accession_raw, form, filing_date_str, doc_filename in zip(accession_numbers, forms, filing_dates, primary_documents):
+            # Cheap cut on the raw "YYYY-MM-DD" string before any datetime parsing: a fiscal label can
+            # run at most one year ahead of the filing date, so older filings can never pass the cutoff.
+            # "recent" is newest first, so every remaining row is older too.
+            filing_year = filing_date_str[:4]
+            if filing_year.isdigit() and int(filing_year) < FISCAL_CUTOFF_YEAR - 1: break
+            if form not in RELEVANT_FORMS: continue
 
             if processed_relevant_count >= MAX_FILINGS_TO_PROCESS:
                  log_lines.append(f"Reached processing limit ({MAX_FILINGS_TO_PROCESS} relevant filings). Stopping search.")
@@ -499,9 +1069,7 @@ def process_filing(cik, ticker, fy_month, fy_adjust, cleanup_flag, log_lines, tm
             # --- Initialize period before try block ---
             period = "N/A"
             try:
-                filing_date_str = filing_dates[i]
-                filing_date = datetime.strptime(filing_date_str, "%Y-%m-%d")
-                period = get_filing_period(form, filing_date, fy_month, fy_adjust) # Assign period here
+                period = get_filing_period(form, filing_date_str, fy_month, fy_adjust) # Assign period here (parses the date)
 
                 year_suffix = -1
                 if period.startswith("FY"): year_suffix = int(period[2:])
@@ -513,7 +1081,6 @@ def process_filing(cik, ticker, fy_month, fy_adjust, cleanup_flag, log_lines, tm
                 processed_relevant_count += 1
 
                 accession_clean = accession_raw.replace('-', '')
-                doc_filename = primary_documents[i]
                 if not doc_filename:
                     log_lines.append(f"Warning: Skipping filing {accession_raw} due to missing primary document name.")
                     processed_relevant_count -= 1
@@ -528,7 +1095,8 @@ def process_filing(cik, ticker, fy_month, fy_adjust, cleanup_flag, log_lines, tm
                     "doc_url": doc_url, "cik": cik_padded, "form": form, "date": filing_date_str,
                     "accession": accession_clean, "ticker": ticker, "fy_month": fy_month,
                     "fy_adjust": fy_adjust, "cleanup_flag": cleanup_flag,
-                    "filing_output_dir": filing_output_dir # Pass specific dir
+                    "filing_output_dir": filing_output_dir, # Pass specific dir
+                    "asset_cache": asset_cache
                 })
 
             except (ValueError, TypeError) as e:
@@ -542,31 +1110,35 @@ def process_filing(cik, ticker, fy_month, fy_adjust, cleanup_flag, log_lines, tm
         log_lines.append(f"Identified {len(tasks_to_submit)} filings matching criteria (up to limit of {MAX_FILINGS_TO_PROCESS}) to process.")
         if not tasks_to_submit:
             st.warning(f"No filings found matching the criteria (10-K/10-Q, from FY{EARLIEST_FISCAL_YEAR_SUFFIX} 10-K onwards, within limit).")
-            return pdf_files
+            return pdf_files, 0, 0
 
         # --- Execute Tasks in Parallel ---
-        processed_success_count = 0
-        with ThreadPoolExecutor(max_workers=4) as executor:
-            # Pass log_lines list - append is generally thread-safe
-            futures = {executor.submit(download_and_process, log_lines=log_lines, **task_details): task_details
-                       for task_details in tasks_to_submit}
-
-            for future in as_completed(futures):
-                task_info = futures[future]
-                acc = task_info.get('accession','N/A')
-                frm = task_info.get('form','N/A')
-                # log_lines.append(f"--- Attempting to get result for {frm} {acc} ---") # Reduce log noise
-                try:
-                    form_type, pdf_path = future.result()
-                    if pdf_path and form_type in pdf_files:
-                        # pdf_path is now the full path including the filing_output_dir
-                        pdf_files[form_type].append(pdf_path)
-                        processed_success_count += 1
-                        # log_lines.append(f"--- Successfully processed {frm} {acc} ---") # Reduce log noise
-                    # else: # Reduce log noise
-                         # log_lines.append(f"--- Task completed for {frm} {acc} but no PDF generated ---")
-                except Exception as e:
-                    log_lines.append(f"--- ERROR retrieving result for {frm} {acc}: {str(e)} ---")
+        # Persistent pool (see get_filing_pool); PDF rendering is handed on to the render process pool
+        # Pass log_lines deque - append is thread-safe
+        futures = {filing_pool.submit(download_and_process, log_lines=log_lines, **task_details): task_details
+                   for task_details in tasks_to_submit}
+        total_tasks = len(futures)
+
+        # Progress bar created here (inside the cached build) so Streamlit can replay it; updated from this thread only
+        progress_bar = st.progress(0.0, text=f"Converting filings: 0 of {total_tasks} done")
+        for completed_count, future in enumerate(as_completed(futures), start=1):
+            progress_bar.progress(completed_count / total_tasks, text=f"Converting filings: {completed_count} of {total_tasks} done")
+            task_info = futures[future]
+            acc = task_info.get('accession','N/A')
+            frm = task_info.get('form','N/A')
+            if DEBUG_LOG: log_lines.append(f"--- Attempting to get result for {frm} {acc} ---") # Reduce log noise
+            try:
+                form_type, pdf_filename, pdf_bytes = future.result()
+                if pdf_bytes and form_type in pdf_files:
+                    # (only returned after convert_to_pdf verified the PDF is non-empty)
+                    pdf_files[form_type].append((pdf_filename, pdf_bytes))
+                    processed_success_count += 1
+                    if DEBUG_LOG: log_lines.append(f"--- Successfully processed {frm} {acc} ---") # Reduce log noise
+                elif DEBUG_LOG: # Reduce log noise
+                     log_lines.append(f"--- Task completed for {frm} {acc} but no PDF generated ---")
+            except Exception as e:
+                log_lines.append(f"--- ERROR retrieving result for {frm} {acc}: {str(e)} ---")
+        progress_bar.empty()
 
     except KeyError as e:
         log_lines.append(f"ERROR: Data format error in submissions JSON (Missing key: {e}).")
@@ -576,53 +1148,115 @@ def process_filing(cik, ticker, fy_month, fy_adjust, cleanup_flag, log_lines, tm
          log_lines.append(traceback.format_exc())
          st.error("An unexpected error occurred during processing.")
 
-    total_generated = len(pdf_files['10-K']) + len(pdf_files['10-Q'])
-    log_lines.append(f"Processing complete. Successfully generated {total_generated} PDF(s) ({len(pdf_files['10-K'])} 10-K, {len(pdf_files['10-Q'])} 10-Q).")
-    return pdf_files
+    log_lines.append(f"Processing complete. Successfully generated {processed_success_count} PDF(s) ({len(pdf_files['10-K'])} 10-K, {len(pdf_files['10-Q'])} 10-Q).")
+    return pdf_files, processed_success_count, total_tasks
 
 
 # --- MODIFIED create_zip_archive function ---
-def create_zip_archive(pdf_files, cik, log_lines, tmp_dir): # tmp_dir is the base temp dir
+def create_zip_archive(pdf_files, cik, log_lines): # Builds the archive in memory
     """
-    Creates a ZIP archive named '<CIK>.zip' containing the generated PDF files
-    from their respective subdirectories.
+    Creates an in-memory ZIP archive for '<CIK>.zip' containing the generated PDFs
+    (in-memory bytes, grouped by form type). Returns the BytesIO buffer (or None).
     """
-    total_pdfs = sum(len(paths) for paths in pdf_files.values())
+    # Flatten once into (arcname, bytes) pairs, e.g. ("10-K/NVDA_FY23.pdf", b"%PDF-...").
+    # ZIP member names always use forward slashes.
+    entries = [(f"{form_type}/{pdf_filename}", pdf_bytes)
+               for form_type, pdfs in pdf_files.items() for pdf_filename, pdf_bytes in pdfs]
+    total_pdfs = len(entries)
     if not total_pdfs:
         log_lines.append("No PDFs were generated, skipping ZIP creation.")
         return None
 
     zip_filename = f"{cik}.zip"
-    zip_path = os.path.join(tmp_dir, zip_filename) # Create zip in base temp dir
+    zip_buffer = BytesIO() # Built in memory, no disk round-trip
     log_lines.append(f"Creating ZIP archive '{zip_filename}' with {total_pdfs} PDF(s)...")
-    added_count = 0
     try:
-        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for form_type, paths in pdf_files.items():
-                if not paths: continue
-                for pdf_full_path in paths: # pdf_full_path includes the filing subdir
-                    if pdf_full_path and os.path.exists(pdf_full_path):
-                        # Create arcname relative to the filing type folder
-                        # e.g., "10-K/NVDA_FY23.pdf"
-                        arcname = os.path.join(form_type, os.path.basename(pdf_full_path))
-                        zipf.write(pdf_full_path, arcname=arcname)
-                        added_count += 1
-                    else:
-                         log_lines.append(f"Warning: Skipping missing/invalid PDF path during zipping: {pdf_full_path}")
-
-        if added_count == total_pdfs:
-             log_lines.append(f"ZIP archive '{zip_filename}' created successfully.")
-        else:
-             log_lines.append(f"Warning: ZIP archive '{zip_filename}' created, but added only {added_count}/{total_pdfs} files.")
-        return zip_path
+        # ZIP_STORED: WeasyPrint PDFs are already flate-compressed internally, so deflate saves ~nothing
+        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_STORED, allowZip64=True) as zipf:
+            # PDFs come straight from the render workers' bytes; nothing is read back from disk
+            for arcname, pdf_bytes in entries:
+                zipf.writestr(arcname, pdf_bytes)
+
+        log_lines.append(f"ZIP archive '{zip_filename}' created successfully.")
+        zip_buffer.seek(0)
+        return zip_buffer
 
     except Exception as e:
         log_lines.append(f"ERROR: Failed to create ZIP archive '{zip_filename}': {str(e)}")
-        if os.path.exists(zip_path):
-            try: os.remove(zip_path)
-            except OSError: pass
         return None
 
+# --- Cached end-to-end build (fetch -> convert -> zip) ---
+class ZipBuildError(Exception):
+    """
+    Raised by run_pipeline (and so build_zip) when the run was not complete (no archive, or some
+    filings failed), so Streamlit does not cache it and the next submit retries. A partial archive
+    rides along in zip_bytes.
+    """
+    def __init__(self, pdf_count, task_count, log_lines, zip_bytes=None):
+        super().__init__("No complete ZIP archive was produced.")
+        self.pdf_count = pdf_count # 0 means no PDFs at all
+        self.task_count = task_count # Filings submitted; more than pdf_count means some failed
+        self.log_lines = log_lines
+        self.zip_bytes = zip_bytes # The partial archive, if one was built
+
+
+def run_pipeline(cik, ticker, fy_month, fy_adjust, cleanup_flag):
+    """
+    Runs the whole pipeline for one set of form inputs and returns (zip_bytes, log_lines).
+    If any submitted filing failed (download, render, ...), or no archive was built,
+    ZipBuildError is raised instead, carrying the partial archive if there is one.
+    Not memoized: see build_zip for the cached entry point used by normal runs.
+    """
+    log_lines = deque(maxlen=LOG_MAX_LINES) # Log buffer for this run (O(1) appends, joined once for display)
+
+    # Use a temporary directory for all intermediate files (HTML, assets, PDF)
+    tmp_dir = tempfile.mkdtemp(prefix="mzansi_") # tmp_dir is the base temp directory
+    try:
+        log_lines.append(f"Using base temporary directory: {tmp_dir}")
+        # --- Call the main processing function ---
+        # tmp_dir is passed as the base directory for creating subdirectories
+        pdf_files_dict, pdf_count, task_count = process_filing(
+            cik=cik,
+            ticker=ticker,
+            fy_month=fy_month,
+            fy_adjust=fy_adjust,
+            cleanup_flag=cleanup_flag,
+            log_lines=log_lines,
+            tmp_dir=tmp_dir
+        )
+
+        # --- Create the ZIP if PDFs were generated ---
+        zip_buffer = None
+        if pdf_count:
+            zip_buffer = create_zip_archive(
+                pdf_files=pdf_files_dict,
+                cik=cik, # Pass CIK for the zip filename
+                log_lines=log_lines
+            )
+    finally:
+        # The ZIP is already in memory; delete the intermediate tree in the background so the
+        # download button doesn't wait on thousands of unlink() calls.
+        threading.Thread(target=shutil.rmtree, args=(tmp_dir,), kwargs={"ignore_errors": True}, daemon=True).start()
+
+    if zip_buffer is None:
+        raise ZipBuildError(pdf_count, task_count, log_lines)
+    if pdf_count < task_count:
+        # Some filings failed (often transiently): hand back the partial ZIP without caching it
+        raise ZipBuildError(pdf_count, task_count, log_lines, zip_buffer.getvalue())
+    return zip_buffer.getvalue(), log_lines
+
+@st.cache_data(ttl=3600, show_spinner=False, max_entries=32)
+def build_zip(cik, ticker, fy_month, fy_adjust):
+    """
+    run_pipeline with cleanup on (intermediate files deleted, rendered PDFs reused from
+    PDF_CACHE_DIR), memoized on (cik, ticker, fy_month, fy_adjust) so re-submitting the same
+    request is a cache lookup. Runs that keep intermediate files call run_pipeline directly: they
+    render from scratch (no PDF cache) and must never be answered from, or stored in, this cache.
+    Entries expire after an hour (same as fetch_submissions) so newly filed reports get picked up.
+    Only complete runs are cached; ZipBuildError (incomplete run) propagates uncached.
+    """
+    return run_pipeline(cik, ticker, fy_month, fy_adjust, cleanup_flag=True)
+
 # -------------------------
 # Streamlit UI (Layout and Widgets)
 # -------------------------
@@ -630,16 +1264,7 @@ st.set_page_config(page_title="Mzansi EDGAR Fetcher", layout="wide")
 st.title("📈 Mzansi EDGAR Fetcher")
 
 # Description mentioning the limit
-st.markdown(f"""
-    **Instructions:**
-    1.  Enter the company's Central Index Key (CIK). [Find CIK here](https://www.sec.gov/edgar/searchedgar/cik).
-    2.  (Optional) Enter the stock ticker (used for PDF filenames if provided).
-    3.  Select the company's Fiscal Year-End Month.
-    4.  Choose the Fiscal Year Basis (usually "Same Year").
-    5.  Click "Fetch Filings". *Fetches up to {MAX_FILINGS_TO_PROCESS} filings: FY{EARLIEST_FISCAL_YEAR_SUFFIX} 10-K and all newer 10-Ks/10-Qs found.*
-    6.  (Optional) Check the box to delete intermediate HTML files after conversion.
-    7.  Check the process log for details, especially if PDF quality is unexpected or errors occur.
-""")
+st.markdown(INSTRUCTIONS_MD)
 
 # --- Input Form ---
 with st.form("filing_form"):
@@ -649,11 +1274,10 @@ with st.form("filing_form"):
         ticker_input = st.text_input("Ticker (Optional, e.g., NVDA):", key="ticker")
     with col2:
         # Month selection with names only
-        month_options = {str(i): datetime(2000, i, 1).strftime('%B') for i in range(1, 13)}
         fy_month_input = st.selectbox(
             "Fiscal Year-End Month:",
-            options=list(month_options.keys()),
-            format_func=lambda x: month_options[x], # Show only month name
+            options=list(MONTH_OPTIONS.keys()),
+            format_func=MONTH_OPTIONS.__getitem__, # Show only month name
             index=11, # Default to December (12)
             key="fy_month"
         )
@@ -689,59 +1313,40 @@ if submitted:
         st.info(f"Processing request for CIK: {cik_clean}...")
         # Expander to show logs, expanded by default
         log_container = st.expander("Show Process Log", expanded=True)
-        log_lines = [] # Initialize log list for this specific run
-
-        # Use a temporary directory for all intermediate files (HTML, assets, PDF, ZIP)
-        with tempfile.TemporaryDirectory() as tmp_dir: # tmp_dir is the base temp directory
-            log_lines.append(f"Using base temporary directory: {tmp_dir}")
-            # Updated spinner text to reflect new limit
-            with st.spinner(f"Fetching data (up to {MAX_FILINGS_TO_PROCESS}), converting files into PDF, and creating ZIP"):
-                # --- Call the main processing function ---
-                # tmp_dir is passed as the base directory for creating subdirectories
-                pdf_files_dict = process_filing(
-                    cik=cik_clean,
-                    ticker=ticker_clean,
-                    fy_month=fy_month_input,
-                    fy_adjust=fy_adjust_input,
-                    cleanup_flag=cleanup_flag_input,
-                    log_lines=log_lines,
-                    tmp_dir=tmp_dir
-                )
-
-                # --- Create and Offer ZIP Download if PDFs were generated ---
-                if any(pdf_files_dict.values()): # Check if the dictionary contains any PDF paths
-                    # Pass the base tmp_dir for creating the zip file
-                    zip_path = create_zip_archive(
-                        pdf_files=pdf_files_dict,
-                        cik=cik_clean, # Pass CIK for the zip filename
-                        log_lines=log_lines,
-                        tmp_dir=tmp_dir
-                    )
-
-                    # If ZIP creation was successful, provide download button
-                    if zip_path and os.path.exists(zip_path):
-                        st.success("✅ Success! Filings processed and zipped.")
-                        try:
-                            # Read zip file data into memory for download
-                            with open(zip_path, "rb") as f:
-                                zip_data = f.read()
-                            # Display download button
-                            st.download_button(
-                                label=f"⬇️ Download {os.path.basename(zip_path)}", # e.g., Download 1018724.zip
-                                data=zip_data,
-                                file_name=os.path.basename(zip_path), # Filename for user
-                                mime="application/zip"
-                            )
-                        except Exception as e:
-                             st.error(f"Error reading ZIP file for download: {e}")
-                             log_lines.append(f"ERROR: Error reading ZIP file for download: {e}")
-                    else:
-                        # Log file should indicate why zip creation failed
-                        st.error("❌ Failed to create the final ZIP archive.")
+        # Updated spinner text to reflect new limit
+        with st.spinner(f"Fetching data (up to {MAX_FILINGS_TO_PROCESS}), converting files into PDF, and creating ZIP"):
+            try:
+                if cleanup_flag_input:
+                    zip_data, log_lines = build_zip(cik_clean, ticker_clean, fy_month_input, fy_adjust_input)
+                else:
+                    # Keeping intermediate files (debugging): always a fresh, uncached run
+                    zip_data, log_lines = run_pipeline(cik_clean, ticker_clean, fy_month_input, fy_adjust_input, cleanup_flag=False)
+                zip_complete = True
+            except ZipBuildError as e:
+                zip_data, log_lines = e.zip_bytes, e.log_lines
+                zip_complete = False
+                if zip_data is not None:
+                    # Partial result: not cached, so submitting again retries the failed filings
+                    st.warning(f"⚠️ Only {e.pdf_count} of {e.task_count} filings were converted. See the log for the failures; submit again to retry them.")
+                elif e.pdf_count:
+                    # Log file should indicate why zip creation failed
+                    st.error("❌ Failed to create the final ZIP archive.")
                 else:
                     # Log file should indicate why no PDFs were generated
                     st.warning("⚠️ No relevant filings were successfully processed into PDFs based on the criteria.")
 
+        # --- Offer ZIP Download if it was created ---
+        if zip_data is not None:
+            if zip_complete: st.success("✅ Success! Filings processed and zipped.")
+            zip_filename = f"{cik_clean}.zip"
+            # Display download button
+            st.download_button(
+                label=f"⬇️ Download {zip_filename}", # e.g., Download 1018724.zip
+                data=zip_data,
+                file_name=zip_filename, # Filename for user
+                mime="application/zip"
+            )
+
         # Display the collected log output inside the expander
         # Ensure log is updated even if spinner finishes early due to error
         with log_container:
@@ -750,5 +1355,5 @@ if submitted:
 # --- Footer ---
 st.markdown("---")
 # Updated caption to mention limit
-st.caption(f"Mzansi EDGAR Fetcher v2.3 | Data sourced from SEC EDGAR | Uses WeasyPrint | Fetches up to {MAX_FILINGS_TO_PROCESS} filings from FY{EARLIEST_FISCAL_YEAR_SUFFIX} 10-K onwards.")
+st.caption(FOOTER_CAPTION)
 